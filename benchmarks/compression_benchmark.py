@@ -0,0 +1,130 @@
+"""
+Benchmark of compressed index storage: memory saved and recall lost
+against exact KDTree over float vectors.
+
+Variants: brute force over float32 / float16 vectors held in memory and
+PQ codes with re-ranking over memory-mapped float16 vectors. Memory is
+bytes of arrays kept in process memory by the backend (KDTree keeps a
+float64 copy of vectors, as the old in-memory embeddings_vectors).
+
+Usage:
+    python -m benchmarks.compression_benchmark [INDEX_DIR] [N_QUERIES] [K]
+    python -m benchmarks.compression_benchmark random ROWS DIM [N_QUERIES]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from config import INDEX_DIR
+from benchmarks.search_benchmark import latency_stats
+from src.embeddings.columns_index import ColumnsIndex
+from src.search.backends import (BruteForceBackend, KDTreeBackend, PQBackend,
+                                 recall_at_k)
+
+
+def memory_bytes(backend) -> int:
+    """Bytes of not memory-mapped arrays of backend."""
+    if isinstance(backend, KDTreeBackend):
+        return backend.tree.data.nbytes + backend.tree.indices.nbytes
+    arrays = [backend.vectors]
+    if isinstance(backend, BruteForceBackend):
+        arrays.append(backend.norms)
+    if isinstance(backend, PQBackend):
+        arrays += [backend.codes, backend.quantizer.codebooks]
+    return sum(array.nbytes for array in arrays
+               if not isinstance(array, np.memmap))
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int = 100,
+                      seed: int = 42) -> np.ndarray:
+    """Random float32 vectors around random centers (like embeddings)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=rows)] + \
+        rng.normal(scale=0.3, size=(rows, dim))
+    return vectors.astype(np.float32)
+
+
+def benchmark_variant(name: str, backend, queries: np.ndarray,
+                      expected: np.ndarray, baseline_bytes: int,
+                      build_sec: float, k: int = 10) -> dict:
+    """Query backend one vector at a time, compare with exact results."""
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found.append(backend.query(query, k=k)[1])
+        latencies.append(time.perf_counter() - start)
+    memory = memory_bytes(backend)
+    return {
+        'variant': name,
+        'build_sec': build_sec,
+        'memory_bytes': memory,
+        'memory_saved': 1 - memory / baseline_bytes,
+        **latency_stats(latencies),
+        f'recall@{k}': recall_at_k(np.array(found), expected, k),
+    }
+
+
+def run(vectors: np.ndarray, n_queries: int = 200, k: int = 10,
+        subvectors: tuple[int, ...] = (8, 16, 32),
+        reranks: tuple[int, ...] = (0, 100, 1000),
+        seed: int = 42) -> list[dict]:
+    """
+    Benchmark compressed variants, queries are noised index vectors.
+
+    PQ variants with subvectors not dividing dimension are skipped.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), n_queries)]
+    queries = queries + rng.normal(scale=queries.std() * 0.1,
+                                   size=queries.shape).astype(np.float32)
+    start = time.perf_counter()
+    exact = KDTreeBackend(vectors)
+    build_sec = time.perf_counter() - start
+    expected = exact.query(queries, k=k)[1]
+    baseline = memory_bytes(exact)
+
+    res = [benchmark_variant('kdtree', exact, queries, expected, baseline,
+                             build_sec, k)]
+    print(res[-1])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        variants = {}
+        for dtype in ('float32', 'float16'):
+            variants[f'brute {dtype}'] = (
+                BruteForceBackend, vectors.astype(dtype), {})
+        # PQ keeps only codes in memory, vectors stay on disk
+        pth = os.path.join(tmp_dir, 'vectors.npy')
+        np.save(pth, vectors.astype(np.float16))
+        mapped = np.load(pth, mmap_mode='r')
+        for n_subvectors in subvectors:
+            if vectors.shape[1] % n_subvectors:
+                continue
+            for rerank in reranks:
+                variants[f'pq {n_subvectors}B rerank {rerank}'] = (
+                    PQBackend, mapped,
+                    {'n_subvectors': n_subvectors, 'rerank': rerank})
+        for name, (backend_cls, data, params) in variants.items():
+            start = time.perf_counter()
+            backend = backend_cls(data, **params)
+            build_sec = time.perf_counter() - start
+            res.append(benchmark_variant(name, backend, queries, expected,
+                                         baseline, build_sec, k))
+            print(res[-1])
+        # memory map is closed before temporary dir is removed
+        del mapped, backend, variants
+    return res
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'random':
+        rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        dim = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+        n_queries = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+        run(clustered_vectors(rows, dim), n_queries)
+    else:
+        index_dir = sys.argv[1] if len(sys.argv) > 1 else INDEX_DIR
+        n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+        k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+        run(ColumnsIndex.load(index_dir).vectors, n_queries, k)
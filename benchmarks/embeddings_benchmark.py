@@ -0,0 +1,110 @@
+"""
+Benchmark of column embeddings: per-cell loop vs batched engine.
+
+Usage:
+    python -m benchmarks.embeddings_benchmark MODEL_PTH [DATA_DIR]
+"""
+import csv
+import os
+import sys
+import time
+import numpy as np
+from gensim.models import FastText
+from config import DATA_DIR
+from src.embeddings.get_embeddins import (ColEmbedding,
+                                          get_columns_embeddings,
+                                          iter_csv_files)
+from src.embeddings.token_cache import TokenVectorCache
+
+
+def reference_columns_embeddings(model, data_dir) -> list['ColEmbedding']:
+    """Original per-cell, per-token loop (kept as baseline)."""
+    res = []
+    for address, dirs, files in os.walk(data_dir):
+        for name in files:
+            file_pth = os.path.join(address, name)
+            if file_pth[-4:] == '.csv':
+                with open(file_pth) as f:
+                    reader = csv.reader(f)
+                    header = next(reader, None)
+                    embeddings = {col_name: 0 for col_name in header}
+                    rows_count = 0
+                    line = next(reader, None)
+                    n_cols = len(header)
+                    while line is not None:
+                        if len(line) != n_cols:
+                            line = next(reader, None)
+                            continue
+                        rows_count += 1
+                        for i in range(n_cols):
+                            vec = 0
+                            for el in line[i].split():
+                                vec += model.wv.get_vector(el)
+                            if len(line[i].split()) == 0 or np.all(vec == 0):
+                                continue
+                            vec = vec / len(line[i].split())
+                            embeddings[header[i]] += vec / len(line[i].split())
+                        line = next(reader, None)
+                    for col_name in header:
+                        if rows_count == 0:
+                            continue
+                        embeddings[col_name] /= rows_count
+                        if np.all(embeddings[col_name] == 0):
+                            continue
+                        res.append(ColEmbedding(file_pth=file_pth,
+                                                col_name=col_name,
+                                                embedding=embeddings[
+                                                    col_name]))
+    return res
+
+
+def count_rows(data_dir) -> int:
+    """Count data rows of all csv files in data_dir."""
+    rows = 0
+    for file_pth in iter_csv_files(data_dir):
+        with open(file_pth) as f:
+            rows += max(sum(1 for _ in csv.reader(f)) - 1, 0)
+    return rows
+
+
+def max_abs_diff(expected: list['ColEmbedding'],
+                 actual: list['ColEmbedding']) -> float:
+    """Max absolute difference between two embeddings lists."""
+    actual_map = {(emb.file_pth, emb.col_name): emb.embedding
+                  for emb in actual}
+    if len(actual_map) != len(expected):
+        raise ValueError(f'Columns count differs: {len(expected)} '
+                         f'!= {len(actual_map)}')
+    return max((float(np.max(np.abs(emb.embedding - actual_map[
+        (emb.file_pth, emb.col_name)]))) for emb in expected), default=0.0)
+
+
+def run(model_pth: str, data_dir: str = DATA_DIR) -> dict:
+    """Run both implementations over data_dir and print rows/sec."""
+    model = FastText.load(model_pth)
+    rows = count_rows(data_dir)
+
+    start = time.perf_counter()
+    expected = reference_columns_embeddings(model, data_dir)
+    loop_time = time.perf_counter() - start
+
+    cache = TokenVectorCache(model.wv)
+    start = time.perf_counter()
+    actual = get_columns_embeddings(model, data_dir, cache=cache)
+    batch_time = time.perf_counter() - start
+
+    res = {
+        'rows': rows,
+        'loop_rows_per_sec': rows / loop_time,
+        'batch_rows_per_sec': rows / batch_time,
+        'speedup': loop_time / batch_time,
+        'max_abs_diff': max_abs_diff(expected, actual),
+        'cache_hit_rate': cache.stats()['hit_rate'],
+    }
+    for key, value in res.items():
+        print(f'{key}: {value}')
+    return res
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:3])
@@ -0,0 +1,159 @@
+"""
+Load test of production server: throughput by number of workers.
+
+Server is started for every workers count, the same requests are sent
+by the same number of clients, so throughput growth shows scaling with
+cores. Then one worker with the default in-flight limit is loaded by more
+clients than its threads: part of requests is rejected with 503.
+
+Usage:
+    python -m benchmarks.load_test MODEL_PTH INDEX_DIR [MAX_WORKERS]
+        [OUTPUT_JSON]
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+import json
+import os
+import socket
+import sys
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from config import SERVER_MAX_IN_FLIGHT, SERVER_THREADS
+from benchmarks.suite import benchmark_http
+from src.embeddings.columns_index import ColumnsIndex
+from src.inference.production import serve
+
+
+def free_port() -> int:
+    """Get free local tcp port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, workers: int, timeout: float = 300):
+    """Wait until all workers answer /ready with 200."""
+    deadline = time.monotonic() + timeout
+    ready = 0
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/ready'):
+                ready += 1
+        except (urllib.error.URLError, ConnectionError):
+            ready = 0
+            time.sleep(0.2)
+        # requests are spread over workers, several answers in a row
+        # mean that most likely all of them are loaded
+        if ready >= 4 * workers:
+            return
+    raise TimeoutError(f'Server {url} is not ready in {timeout} sec')
+
+
+def status_counts(url: str, payloads: list[dict], concurrency: int
+                  ) -> dict:
+    """Send payloads with concurrency clients, count response statuses."""
+    def send(payload):
+        req = urllib.request.Request(
+            url, data=json.dumps(payload).encode(),
+            headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 'connection error'
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return dict(Counter(pool.map(send, payloads)))
+
+
+def start_server(model_pth: str, index_dir: str, workers: int,
+                 **params) -> tuple[Process, str]:
+    """Start production server in subprocess, wait until it is ready."""
+    port = free_port()
+    server = Process(target=serve, kwargs={
+        'host': '127.0.0.1', 'port': port, 'workers': workers,
+        'model_pth': model_pth, 'index_dir': index_dir, **params})
+    server.start()
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_ready(url, workers)
+    except BaseException:
+        server.terminate()
+        server.join()
+        raise
+    return server, url
+
+
+def run(model_pth: str, index_dir: str, max_workers: int | None = None,
+        output_pth: str = 'load_test_results.json', n_requests: int = 200,
+        concurrency: int | None = None, seed: int = 42) -> list[dict]:
+    """
+    Measure /predict_on_file and /predict_on_vector with 1, 2, 4, ...
+    max_workers workers (default os.cpu_count()), then load shedding of
+    one worker.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    concurrency = concurrency or 2 * max_workers
+    info = ColumnsIndex.load(index_dir)
+    rng = np.random.default_rng(seed)
+    vector_payloads = [{'embedding': vec.tolist()} for vec in
+                       info.vectors[rng.choice(len(info), n_requests)]]
+    file_payloads = [{'file_pth': os.path.abspath(info.files[i])} for i in
+                     rng.choice(len(info.files), n_requests)]
+    workers_counts = sorted({min(2 ** i, max_workers)
+                             for i in range(max_workers.bit_length() + 1)})
+    res = []
+    for workers in workers_counts:
+        # no in-flight limit: the test measures throughput, not shedding;
+        # no result cache: payloads repeat, hits would be measured
+        server, url = start_server(model_pth, index_dir, workers,
+                                   max_in_flight=None,
+                                   result_cache_entries=0)
+        try:
+            res.append({
+                'workers': workers,
+                'concurrency': concurrency,
+                'predict_on_file': benchmark_http(
+                    url + '/predict_on_file', file_payloads, concurrency),
+                'predict_on_vector': benchmark_http(
+                    url + '/predict_on_vector', vector_payloads,
+                    concurrency),
+            })
+        finally:
+            server.terminate()
+            server.join()
+        print(f"workers={workers}: "
+              f"file {res[-1]['predict_on_file']['requests_per_sec']:.1f} "
+              f"rps, vector "
+              f"{res[-1]['predict_on_vector']['requests_per_sec']:.1f} rps")
+
+    # more clients than threads of one worker: excess is rejected
+    shed_concurrency = 4 * SERVER_THREADS
+    server, url = start_server(model_pth, index_dir, 1,
+                               result_cache_entries=0)
+    try:
+        statuses = status_counts(url + '/predict_on_file', file_payloads,
+                                 shed_concurrency)
+    finally:
+        server.terminate()
+        server.join()
+    res.append({'workers': 1, 'concurrency': shed_concurrency,
+                'threads': SERVER_THREADS,
+                'max_in_flight': SERVER_MAX_IN_FLIGHT,
+                'shedding_statuses': statuses})
+    print(f'shedding (1 worker, {shed_concurrency} clients): {statuses}')
+    with open(output_pth, 'w') as f:
+        json.dump(res, f, indent=2)
+    return res
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], sys.argv[2],
+        int(sys.argv[3]) if len(sys.argv) > 3 else None,
+        sys.argv[4] if len(sys.argv) > 4 else 'load_test_results.json')
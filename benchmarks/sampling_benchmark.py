@@ -0,0 +1,59 @@
+"""
+Benchmark of rows sampling: speedup and cosine drift from full scan.
+
+Usage:
+    python -m benchmarks.sampling_benchmark MODEL_PTH [DATA_DIR] [N_ROWS]
+"""
+import sys
+import time
+import numpy as np
+from gensim.models import FastText
+from src.embeddings.get_embeddins import get_columns_embeddings
+from src.embeddings.sampling import cosine_drift, make_sampler
+from src.embeddings.token_cache import TokenVectorCache
+
+
+def run(model_pth: str, data_dir: str = 'test_data',
+        n_rows: int = 1000) -> list[dict]:
+    """Compare every sampling strategy with full scan of data_dir."""
+    model = FastText.load(model_pth)
+    strategies = {
+        'full': {},
+        'head': {'n_rows': n_rows},
+        'reservoir': {'n_rows': n_rows},
+        'converge': {'check_rows': n_rows, 'min_rows': n_rows,
+                     'tol': 1e-3},
+    }
+    res = []
+    full = full_time = None
+    for strategy, params in strategies.items():
+        # new cache for every run: warm cache would hide the real cost
+        cache = TokenVectorCache(model.wv)
+        start = time.perf_counter()
+        embeddings = get_columns_embeddings(
+            model, data_dir, cache=cache,
+            sampler=make_sampler(strategy, **params))
+        run_time = time.perf_counter() - start
+        if full is None:
+            full, full_time = embeddings, run_time
+        sampled = {(emb.file_pth, emb.col_name): emb.embedding
+                   for emb in embeddings}
+        drift = np.array([
+            cosine_drift(emb.embedding,
+                         sampled.get((emb.file_pth, emb.col_name),
+                                     np.zeros_like(emb.embedding)))[0]
+            for emb in full])
+        res.append({
+            'strategy': strategy,
+            'sec': run_time,
+            'speedup': full_time / run_time,
+            'mean_cosine_drift': float(drift.mean()) if len(drift) else 0.,
+            'max_cosine_drift': float(drift.max()) if len(drift) else 0.,
+        })
+        print(res[-1])
+    return res
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], *sys.argv[2:3],
+        *[int(arg) for arg in sys.argv[3:4]])
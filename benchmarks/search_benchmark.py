@@ -0,0 +1,74 @@
+"""
+Benchmark of search backends: build time, query latency and recall@k.
+
+Usage:
+    python -m benchmarks.search_benchmark [INDEX_DIR] [N_QUERIES] [K]
+"""
+import sys
+import time
+import numpy as np
+from config import INDEX_DIR
+from src.embeddings.columns_index import ColumnsIndex
+from src.search.backends import BACKENDS, make_backend, recall_at_k
+
+
+def latency_stats(latencies: list[float]) -> dict:
+    """Get latency percentiles in milliseconds."""
+    latencies = np.array(latencies) * 1000
+    return {f'p{q}_ms': float(np.percentile(latencies, q))
+            for q in (50, 95, 99)}
+
+
+def benchmark_backend(name: str, vectors: np.ndarray, queries: np.ndarray,
+                      expected: np.ndarray, k: int = 10,
+                      **params) -> dict:
+    """Build backend, query it one vector at a time, compare with exact."""
+    start = time.perf_counter()
+    backend = make_backend(name, vectors, **params)
+    build_time = time.perf_counter() - start
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found.append(backend.query(query, k=k)[1])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    backend.query(queries, k=k)
+    batch_time = time.perf_counter() - start
+    return {
+        'backend': name,
+        'build_sec': build_time,
+        **latency_stats(latencies),
+        'batch_queries_per_sec': len(queries) / batch_time,
+        f'recall@{k}': recall_at_k(np.array(found), expected, k),
+    }
+
+
+def run(vectors: np.ndarray, n_queries: int = 200, k: int = 10,
+        seed: int = 42) -> list[dict]:
+    """
+    Benchmark all backends, queries are noised index vectors.
+
+    Recall is measured against exact search with the same metric.
+    """
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(vectors[rng.choice(len(vectors), n_queries)],
+                         dtype=np.float32)
+    queries += rng.normal(scale=queries.std() * 0.1,
+                          size=queries.shape).astype(np.float32)
+    expected = {
+        'euclidean': make_backend('brute', vectors).query(queries, k=k)[1],
+        'cosine': make_backend('cosine', vectors).query(queries, k=k)[1],
+    }
+    res = []
+    for name, backend in BACKENDS.items():
+        res.append(benchmark_backend(name, vectors, queries,
+                                     expected[backend.metric], k))
+        print(res[-1])
+    return res
+
+
+if __name__ == '__main__':
+    index_dir = sys.argv[1] if len(sys.argv) > 1 else INDEX_DIR
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    run(ColumnsIndex.load(index_dir).vectors, n_queries, k)
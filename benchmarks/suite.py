@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark: embedding, index build, search and http serving.
+
+Fixed synthetic warehouse is generated offline by generate_benchmark_data
+(same seed gives the same tables), results are saved as JSON.
+
+Usage:
+    python -m benchmarks.suite MODEL_PTH [OUTPUT_JSON] [TABLES] [ROWS]
+    python -m benchmarks.suite compare BASELINE_JSON CURRENT_JSON [TOL]
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import numpy as np
+from werkzeug.serving import WSGIRequestHandler, make_server
+from benchmarks.embeddings_benchmark import count_rows
+from benchmarks.search_benchmark import latency_stats
+from benchmarks import search_benchmark
+from data_generation.generate_simulation_data import (
+    generate_benchmark_data, load_ground_truth)
+from src.embeddings.columns_index import ColumnsIndex
+from src.embeddings.parallel_index import build_index, save_index
+from src.inference import model_api
+from src.search.backends import make_backend
+
+WORK_DIR = 'benchmark_work'
+
+
+def prepare_data(work_dir: str, tables: int, rows: int,
+                 seed: int = 42) -> tuple[str, str]:
+    """Generate warehouse once per (tables, rows, seed), get dir and labels."""
+    data_dir = os.path.join(work_dir, f'data_{tables}x{rows}_{seed}')
+    ground_truth_pth = data_dir + '_ground_truth.csv'
+    if not os.path.exists(ground_truth_pth):
+        generate_benchmark_data(save_dir_path=data_dir, tables=tables,
+                                row_min=rows, row_max=rows, seed=seed,
+                                ground_truth_pth=ground_truth_pth)
+    return data_dir, ground_truth_pth
+
+
+def dir_size(pth: str) -> int:
+    """Total size of files in directory."""
+    return sum(os.path.getsize(os.path.join(address, name))
+               for address, dirs, files in os.walk(pth) for name in files)
+
+
+def _max_rss(who: int) -> int:
+    """Peak resident memory in bytes (ru_maxrss is in KiB on linux)."""
+    return resource.getrusage(who).ru_maxrss * 1024
+
+
+def benchmark_index(model_pth: str, data_dir: str, index_dir: str,
+                    workers: int | None = None) -> dict:
+    """
+    Embed data_dir and save index: rows/sec, time and memory.
+
+    Memory is peak RSS of this process and of the largest pool worker
+    (tracemalloc is not used, it slows embedding down several times).
+    """
+    rows = count_rows(data_dir)
+    start = time.perf_counter()
+    embeddings = build_index(model_pth, data_dir, workers=workers,
+                             verbose=False)
+    embed_time = time.perf_counter() - start
+    save_index(embeddings, index_dir)
+    build_time = time.perf_counter() - start
+    return {
+        'rows': rows,
+        'columns': len(embeddings),
+        'embed_rows_per_sec': rows / embed_time,
+        'build_sec': build_time,
+        'max_rss_bytes': _max_rss(resource.RUSAGE_SELF),
+        'worker_max_rss_bytes': _max_rss(resource.RUSAGE_CHILDREN),
+        'index_bytes': dir_size(index_dir),
+    }
+
+
+def provider_precision(info: ColumnsIndex, ground_truth: dict,
+                       k: int = 10) -> float:
+    """Share of k nearest columns (self excluded) with the same provider."""
+    providers = [ground_truth.get((emb.file_pth, emb.col_name))
+                 for emb in info]
+    tree = make_backend('brute', info.vectors)
+    _, neighbors = tree.query(info.vectors, k=k + 1)
+    hits = total = 0
+    for i, row in enumerate(neighbors):
+        row = [j for j in row if j != i][:k]
+        hits += sum(providers[j] == providers[i] for j in row)
+        total += len(row)
+    return hits / max(total, 1)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    """Request handler without access log (it slows down the server)."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _post(url: str, payload: dict) -> float:
+    """POST json, get latency in seconds (raises on http error)."""
+    data = json.dumps(payload).encode()
+    req = urllib.request.Request(url, data=data, headers={
+        'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(req) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def benchmark_http(url: str, payloads: list[dict], concurrency: int = 4
+                   ) -> dict:
+    """Send all payloads with concurrency clients: throughput, latency."""
+    errors = 0
+
+    def send(payload):
+        nonlocal errors
+        try:
+            return _post(url, payload)
+        except OSError:
+            errors += 1
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [lat for lat in pool.map(send, payloads)
+                     if lat is not None]
+    total_time = time.perf_counter() - start
+    return {
+        'requests': len(payloads),
+        'errors': errors,
+        'requests_per_sec': len(latencies) / total_time,
+        **(latency_stats(latencies) if latencies else {}),
+    }
+
+
+def benchmark_server(model_pth: str, index_dir: str, files: list[str],
+                     n_requests: int = 200, concurrency: int = 4,
+                     seed: int = 42) -> dict:
+    """
+    Serve app on free local port, load /predict_on_* endpoints.
+
+    Result cache is disabled: payloads repeat, hits would be measured.
+    """
+    model_api.set_result_cache_size(0)
+    model_api.load_model(model_pth)
+    info = model_api.load_index(index_dir).info
+    server = make_server('127.0.0.1', 0, model_api.app, threaded=True,
+                         request_handler=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    rng = np.random.default_rng(seed)
+    try:
+        vectors = info.vectors[rng.choice(len(info), n_requests)]
+        res = {
+            'predict_on_vector': benchmark_http(
+                url + '/predict_on_vector',
+                [{'embedding': vec.tolist()} for vec in vectors],
+                concurrency),
+            'predict_on_file': benchmark_http(
+                url + '/predict_on_file',
+                [{'file_pth': os.path.abspath(files[i])} for i in
+                 rng.choice(len(files), max(n_requests // 10, 1))],
+                concurrency),
+        }
+    finally:
+        server.shutdown()
+    return res
+
+
+def environment() -> dict:
+    """Python, platform and git revision of the run."""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                                  capture_output=True, text=True,
+                                  check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_revision': revision,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run(model_pth: str, output_pth: str = 'benchmark_results.json',
+        tables: int = 50, rows: int = 1000, work_dir: str = WORK_DIR,
+        n_queries: int = 200, k: int = 10) -> dict:
+    """Run all benchmarks, save results to output_pth."""
+    data_dir, ground_truth_pth = prepare_data(work_dir, tables, rows)
+    index_dir = os.path.join(work_dir, 'index')
+    res = {'environment': environment(),
+           'params': {'tables': tables, 'rows': rows,
+                      'n_queries': n_queries, 'k': k}}
+    print('Index build...')
+    res['index'] = benchmark_index(model_pth, data_dir, index_dir)
+    info = ColumnsIndex.load(index_dir)
+    res['index'][f'provider_precision@{k}'] = provider_precision(
+        info, load_ground_truth(ground_truth_pth), k)
+    print('Search...')
+    res['search'] = {item.pop('backend'): item for item in
+                     search_benchmark.run(info.vectors, n_queries, k)}
+    print('Serving...')
+    res['http'] = benchmark_server(model_pth, index_dir, info.files)
+    res['max_rss_bytes'] = _max_rss(resource.RUSAGE_SELF)
+    with open(output_pth, 'w') as f:
+        json.dump(res, f, indent=2)
+    print(f'Results saved to {output_pth}')
+    return res
+
+
+def _flatten(res: dict, prefix: str = '') -> dict:
+    """Flatten nested results to {'a.b.c': number}."""
+    flat = {}
+    for key, value in res.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and \
+                not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline_pth: str, current_pth: str,
+            tolerance: float = 0.2) -> list[str]:
+    """
+    Get metrics of current run worse than baseline by more than tolerance.
+
+    Throughput, recall and precision should not drop; time, latency and
+    memory should not grow.
+    """
+    with open(baseline_pth) as f:
+        baseline = _flatten(json.load(f))
+    with open(current_pth) as f:
+        current = _flatten(json.load(f))
+    regressions = []
+    for key, old in baseline.items():
+        new = current.get(key)
+        if new is None or key.startswith(('environment.', 'params.')):
+            continue
+        if key.endswith('per_sec') or 'recall' in key or 'precision' in key:
+            worse = new < old * (1 - tolerance)
+        elif key.endswith(('_sec', '_ms', '_bytes')):
+            worse = new > old * (1 + tolerance)
+        else:
+            continue
+        if worse:
+            regressions.append(f'{key}: {old:.4g} -> {new:.4g}')
+    for line in regressions:
+        print(line)
+    return regressions
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'compare':
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.2
+        sys.exit(1 if compare(sys.argv[2], sys.argv[3], tolerance) else 0)
+    run(sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else 'benchmark_results.json',
+        int(sys.argv[3]) if len(sys.argv) > 3 else 50,
+        int(sys.argv[4]) if len(sys.argv) > 4 else 1000)
@@ -0,0 +1,43 @@
+"""
+Benchmark of FastText training input: sentences/sec.
+
+Compares torch DataLoader over DirectIterationDataset (old pipeline) with
+ShuffledCellSentences.
+Usage:
+    python -m benchmarks.training_input_benchmark [DATA_DIR] [N_SENTENCES]
+"""
+import sys
+import time
+from itertools import islice
+from torch.utils.data import DataLoader
+from config import DATA_DIR
+from src.data_process.data_classes import (DirectIterationDataset,
+                                           ShuffledCellSentences)
+
+
+def sentences_per_sec(sentences, n_sentences: int) -> float:
+    """Read n_sentences from iterable, get speed."""
+    start = time.perf_counter()
+    count = sum(1 for _ in islice(sentences, n_sentences))
+    return count / (time.perf_counter() - start)
+
+
+def run(data_dir: str = DATA_DIR, n_sentences: int = 100000) -> dict:
+    """Measure both pipelines on first n_sentences sentences."""
+    dataloader = DataLoader(DirectIterationDataset(data_dir),
+                            batch_size=1, shuffle=True)
+    res = {
+        'dataloader_sentences_per_sec': sentences_per_sec(dataloader,
+                                                          n_sentences),
+        'shuffled_sentences_per_sec': sentences_per_sec(
+            ShuffledCellSentences(data_dir), n_sentences),
+    }
+    res['speedup'] = res['shuffled_sentences_per_sec'] / \
+        res['dataloader_sentences_per_sec']
+    for key, value in res.items():
+        print(f'{key}: {value}')
+    return res
+
+
+if __name__ == '__main__':
+    run(*sys.argv[1:2], *[int(arg) for arg in sys.argv[2:3]])
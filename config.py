@@ -1 +1,42 @@
 DATA_DIR = 'data'
+# memory cap of token -> vector cache used for FastText lookups
+TOKEN_CACHE_MAX_BYTES = 256 * 1024 ** 2
+EMBEDDINGS_PTH = 'embeddings/embeddings.pkl'
+MANIFEST_PTH = 'embeddings/manifest.json'
+INDEX_DIR = 'embeddings/index'
+SEARCH_BACKEND = 'kdtree'  # 'kdtree', 'brute', 'cosine', 'ivf' or 'pq'
+# compressed index storage, see src/embeddings/quantization.py; every
+# index write uses it (python main.py compress_index applies a change)
+INDEX_VECTORS_DTYPE = 'float32'  # 'float16' halves memory of vectors
+INDEX_PQ_SUBVECTORS = 0  # bytes per PQ code (0 - 'pq' trains it on load)
+SEARCH_PQ_RERANK = 100  # 'pq' candidates re-ranked by exact distance
+# value sketches of columns (join discovery), see src/embeddings/sketches.py
+INDEX_SKETCHES = True
+SKETCH_NUM_PERM = 128  # MinHash signature length
+SKETCH_HLL_P = 10  # HLL has 2 ** SKETCH_HLL_P registers
+LSH_THRESHOLD = 0.5  # Jaccard from which columns become LSH candidates
+# infer column types while indexing, search only compatible types
+INDEX_PROFILES = True
+SEARCH_PARTITION_BY_TYPE = True
+MODEL_PTH = 'models/fasttext_one_element_240130-043242.model'
+ROW_INDEX_DIR = 'cache/row_index'
+CORPUS_PTH = 'cache/corpus.txt'
+BENCHMARK_DATA_DIR = 'benchmark_data'
+# column -> Faker provider labels of BENCHMARK_DATA_DIR
+GROUND_TRUTH_PTH = 'benchmark_data_ground_truth.csv'
+# production server (python main.py raise_server prod [WORKERS])
+SERVER_WORKERS = None  # None - os.cpu_count()
+SERVER_THREADS = 4  # threads per worker, spare ones answer 503 when busy
+SERVER_BACKLOG = 64  # connections waiting to be accepted
+SERVER_MAX_IN_FLIGHT = 2  # requests per worker (< threads), above them 503
+SERVER_QUEUE_LIMIT = 16  # connections per worker waiting for a thread
+SERVER_TIMEOUT = 120  # seconds, stuck workers are restarted
+# limits of csv upload to /predict_on_upload
+UPLOAD_MAX_BYTES = 100 * 1024 ** 2
+UPLOAD_TIMEOUT = 60  # seconds
+UPLOAD_MAX_ROWS = 100000  # rows embedded, then reading stops
+# server responses cache (invalidated on index reload)
+RESULT_CACHE_MAX_ENTRIES = 10000  # 0 disables cache
+RESULT_CACHE_TTL = 3600  # seconds
+RESULT_CACHE_QUANTUM = 1e-4  # query vectors are rounded to it for the key
+RESULT_CACHE_MAX_UPLOAD_BYTES = 1024 ** 2  # bigger uploads are not cached
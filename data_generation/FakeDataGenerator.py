@@ -2,10 +2,56 @@
 from faker import Faker
 import pandas as pd
 import random
+from collections import namedtuple
+from multiprocessing import Pool
 from typing import Optional, Union, Sequence, Dict
+import hashlib
 import inspect
 import os
 
+GeneratedTable = namedtuple('GeneratedTable', 'save_pth, columns, providers')
+# discovered providers of Faker by locale (probing them is slow)
+_providers_cache: Dict[str, list] = {}
+# generator of worker process, see _generate_table_in_worker
+_worker_generator = None
+
+
+def get_providers(fake: Faker) -> list:
+    """Get names of Faker methods that return str (cached by locale)."""
+    key = repr(fake.locales)
+    if key in _providers_cache:
+        return _providers_cache[key]
+    all_providers = []
+    for attr in dir(fake):
+        if 'local' in attr or '__' in attr or 'random' in attr or\
+            attr in ['tsv', 'csv', 'pcv',
+                     'fixed_width', 'json', 'dsv'] or \
+            ('ru_RU' in fake.locales and
+                attr in ['suffix_male', 'suffix_female',
+                         'suffix_nonbinary', 'suffix']):
+            continue
+        try:
+            if inspect.ismethod(getattr(fake, attr)) and (
+                        isinstance(getattr(fake, attr)(), str)
+                        ):
+                all_providers.append(attr)
+        except Exception:
+            #  Calling `attr` on instances maybe deprecated.
+            #  In ismethod we can take some bad methods.
+            continue
+    _providers_cache[key] = all_providers
+    return all_providers
+
+
+def _generate_table_in_worker(args):
+    """Create one table in pool worker (generator is created once)."""
+    global _worker_generator
+    init_kwargs, table_index, table_seed, create_kwargs = args
+    if _worker_generator is None:
+        _worker_generator = FakeDataGenerator(**init_kwargs)
+    return _worker_generator.create_table(table_index, table_seed,
+                                          **create_kwargs)
+
 
 class FakeDataGenerator:
     """Class for generate artificial DWH data."""
@@ -22,58 +68,120 @@ class FakeDataGenerator:
         """Init faker."""
         self.fake_data_count = fake_data_count
         self.save_dir_path = save_dir_path
+        self.seed = seed
         self.locale = locale
         self.fake = Faker(
             locale=locale,
             seed=seed
             )
 
-    def create_random_data(self,
-                           column_min=3,
-                           column_max=10,
-                           row_min=300,
-                           row_max=1000):
-        """Create and save fake data using Faker."""
-        # Get all methods that we can use to fake
-        all_providers = []
-        for attr in dir(self.fake):
-            if 'local' in attr or '__' in attr or 'random' in attr or\
-                attr in ['tsv', 'csv', 'pcv',
-                         'fixed_width', 'json', 'dsv'] or \
-                ('ru_RU' in self.fake.locales and
-                    attr in ['suffix_male', 'suffix_female',
-                             'suffix_nonbinary', 'suffix']):
-                continue
-            try:
-                if inspect.ismethod(getattr(self.fake, attr)) and (
-                            isinstance(getattr(self.fake, attr)(), str)
-                            ):
-                    all_providers.append(attr)
-            except Exception:
-                #  Calling `attr` on instances maybe deprecated.
-                #  In ismethod we can take some bad methods.
-                continue
-        for table_index in range(0, self.fake_data_count):
-            # Get random columns, rows count
-            num_columns = random.randint(column_min, column_max)
-            num_rows = random.randint(row_min, row_max)
-            table_structure = random.sample(all_providers, num_columns)
+    def table_seed(self, table_index: int) -> int:
+        """Deterministic seed of table (random one if self.seed is None)."""
+        if self.seed is None:
+            return random.getrandbits(63)
+        key = f'{self.seed}:{table_index}'.encode()
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+                              'big') >> 1
 
+    def create_table(self, table_index: int, table_seed: int,
+                     column_min=3, column_max=10,
+                     row_min=300, row_max=1000,
+                     chunk_rows=10000, file_format='csv',
+                     anonymous_columns=False) -> 'GeneratedTable':
+        """
+        Create and save one fake table.
+
+        Table depends only on table_seed (module random is seeded by it
+        too). Rows are generated and written by chunks of chunk_rows,
+        file_format is 'csv' or 'parquet' (needs pyarrow). Columns are
+        named by their Faker providers, or col_0, col_1, ... if
+        anonymous_columns.
+        Returns path, column names and provider of every column.
+        """
+        # providers are probed before seeding: probing uses faker random
+        all_providers = get_providers(self.fake)
+        rnd = random.Random(table_seed)
+        self.fake.seed_instance(table_seed)
+        # some providers (passport_full of en_US...) use module random
+        random.seed(table_seed)
+        # Get random columns, rows count
+        num_columns = rnd.randint(column_min, column_max)
+        num_rows = rnd.randint(row_min, row_max)
+        table_structure = rnd.sample(all_providers, num_columns)
+        columns = [f'col_{i}' for i in range(num_columns)] \
+            if anonymous_columns else table_structure
+
+        # TODO: encode file_name
+        file_name = f"random_fake_table_{table_index}_{self.locale}." + \
+            file_format
+        save_pth = os.path.join(self.save_dir_path, file_name)
+        writer = None
+        for start in range(0, num_rows, chunk_rows):
             # Generate data for every column
             # TODO: encode columns
-            data = {column: [getattr(self.fake, column)()
-                             for _ in range(num_rows)]
-                    for column in table_structure}
-
+            data = {column: [getattr(self.fake, provider)()
+                             for _ in range(min(chunk_rows,
+                                                num_rows - start))]
+                    for column, provider in zip(columns, table_structure)}
             df = pd.DataFrame(data)
+            if file_format == 'parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(save_pth, table.schema)
+                writer.write_table(table)
+            else:
+                df.to_csv(save_pth, index=False, mode='w' if start == 0
+                          else 'a', header=start == 0)
+        if writer is not None:
+            writer.close()
+        return GeneratedTable(save_pth, columns, table_structure)
+
+    def iter_tables(self, workers=1, **create_kwargs):
+        """
+        Create fake_data_count tables, yield GeneratedTable in order.
+
+        With workers > 1 tables are sharded across processes. If seed is
+        set, tables are the same for any workers count.
+        create_kwargs are passed to create_table.
+        """
+        tables = [(table_index, self.table_seed(table_index))
+                  for table_index in range(0, self.fake_data_count)]
+        if workers == 1:
+            for table_index, table_seed in tables:
+                yield self.create_table(table_index, table_seed,
+                                        **create_kwargs)
+            return
+        init_kwargs = {'save_dir_path': self.save_dir_path,
+                       'seed': self.seed, 'locale': self.locale}
+        get_providers(self.fake)  # forked workers inherit the cache
+        with Pool(workers) as pool:
+            yield from pool.imap(_generate_table_in_worker,
+                                 [(init_kwargs, table_index, table_seed,
+                                   create_kwargs)
+                                  for table_index, table_seed in tables])
 
-            # Save to csv file
-            # TODO: encode file_name
-            file_name = f"random_fake_table_{table_index}_{self.locale}.csv"
-            save_pth = os.path.join(self.save_dir_path, file_name)
-            df.to_csv(save_pth, index=False)
+    def create_random_data(self,
+                           column_min=3,
+                           column_max=10,
+                           row_min=300,
+                           row_max=1000,
+                           workers=1,
+                           chunk_rows=10000,
+                           file_format='csv'):
+        """
+        Create and save fake data using Faker.
 
-            print(f"Table {table_index} saved to file: {save_pth}")
+        With workers > 1 tables are sharded across processes. If seed is
+        set, tables are the same for any workers count.
+        """
+        tables = self.iter_tables(workers, column_min=column_min,
+                                  column_max=column_max, row_min=row_min,
+                                  row_max=row_max, chunk_rows=chunk_rows,
+                                  file_format=file_format)
+        for table_index, table in enumerate(tables):
+            print(f"Table {table_index} saved to file: {table.save_pth}")
 
 
 if __name__ == '__main__':
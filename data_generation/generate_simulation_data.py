@@ -1,6 +1,8 @@
 """Generate artificial data and get random datasets."""
-from data_generation.RandomKaggleDataset import RandomKaggleDataset
 from data_generation.FakeDataGenerator import FakeDataGenerator
+from typing import Sequence
+import csv
+import os
 
 
 def generate_data(
@@ -10,6 +12,9 @@ def generate_data(
         table_per_query=5
         ):
     """Generate artificial data and get random datasets."""
+    # kaggle authenticates on import, offline generation doesn't need it
+    from data_generation.RandomKaggleDataset import RandomKaggleDataset
+
     fakegenerator_ru = FakeDataGenerator(locale='ru_RU',
                                          fake_data_count=fake_data_count//2,
                                          save_dir_path=save_dir_path
@@ -26,3 +31,80 @@ def generate_data(
                                       table_per_query,
                                       data_path=save_dir_path)
     rnd_kag_dat.pipeline()
+
+
+def generate_benchmark_data(
+        save_dir_path='benchmark_data',
+        tables=100,
+        column_min=3,
+        column_max=10,
+        row_min=300,
+        row_max=1000,
+        locales: Sequence[str] = ('en_US', 'ru_RU'),
+        seed=42,
+        workers=1,
+        anonymous_columns=True,
+        ground_truth_pth=None
+        ) -> str:
+    """
+    Generate offline benchmark warehouse with ground-truth labels.
+
+    Only Faker tables are generated (no network). Tables are split
+    between locales; every column is labelled by its Faker provider in
+    csv file (file_pth, col_name, provider, locale), columns with the
+    same provider are "the same kind". Labels are written while tables
+    are generated, so millions of columns don't stay in memory.
+
+    Args:
+        save_dir_path (str, optional): tables directory.
+            Defaults to 'benchmark_data'.
+        tables (int, optional): tables count. Defaults to 100.
+        column_min, column_max (int, optional): columns per table.
+        row_min, row_max (int, optional): rows per table.
+        locales (Sequence[str], optional): Faker locales.
+            Defaults to ('en_US', 'ru_RU').
+        seed (int, optional): same seed gives the same warehouse.
+            Defaults to 42.
+        workers (int, optional): generating processes. Defaults to 1.
+        anonymous_columns (bool, optional): name columns col_0, col_1...
+            so that names don't give out providers. Defaults to True.
+        ground_truth_pth (str, optional): labels path. Defaults to None
+            (<save_dir_path>_ground_truth.csv, outside of tables dir so
+            that it is not indexed as a table).
+
+    Returns:
+        str: path of ground truth labels.
+    """
+    os.makedirs(save_dir_path, exist_ok=True)
+    ground_truth_pth = ground_truth_pth or \
+        os.path.normpath(save_dir_path) + '_ground_truth.csv'
+    columns_count = 0
+    with open(ground_truth_pth, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file_pth', 'col_name', 'provider', 'locale'])
+        for locale_ind, locale in enumerate(locales):
+            # first locales take the remainder of tables
+            locale_tables = tables // len(locales) + \
+                (locale_ind < tables % len(locales))
+            generator = FakeDataGenerator(fake_data_count=locale_tables,
+                                          save_dir_path=save_dir_path,
+                                          seed=seed,
+                                          locale=locale)
+            for table in generator.iter_tables(
+                    workers, column_min=column_min, column_max=column_max,
+                    row_min=row_min, row_max=row_max,
+                    anonymous_columns=anonymous_columns):
+                writer.writerows([table.save_pth, col_name, provider, locale]
+                                 for col_name, provider in
+                                 zip(table.columns, table.providers))
+                columns_count += len(table.columns)
+            print(f'{locale}: {locale_tables} tables generated.')
+    print(f'{columns_count} columns labelled in {ground_truth_pth}')
+    return ground_truth_pth
+
+
+def load_ground_truth(ground_truth_pth: str) -> dict[tuple[str, str], str]:
+    """Get provider of every (file_pth, col_name) of benchmark data."""
+    with open(ground_truth_pth, newline='', encoding='utf-8') as f:
+        return {(row['file_pth'], row['col_name']): row['provider']
+                for row in csv.DictReader(f)}
@@ -1,15 +1,29 @@
 """Startpoint."""
-from data_generation.generate_simulation_data import generate_data
+from data_generation.generate_simulation_data import generate_data, \
+    generate_benchmark_data
 from src.inference import raise_server
 from data_generation.disintersect import disintersect_folders
 import sys
-from config import DATA_DIR
+from config import DATA_DIR, EMBEDDINGS_PTH, INDEX_DIR, CORPUS_PTH, \
+    BENCHMARK_DATA_DIR, GROUND_TRUTH_PTH, INDEX_SKETCHES, INDEX_PROFILES, \
+    INDEX_VECTORS_DTYPE, INDEX_PQ_SUBVECTORS
+from src.data_process.corpus import compile_corpus
+from src.embeddings.incremental_index import build_manifest, \
+    save_manifest, update_index
+from src.embeddings.columns_index import ColumnsIndex, \
+    convert_pickle_index
 from src.embeddings.FastTextOneElement import FastTextOneElement
+from src.embeddings.parallel_index import build_index, save_index
+from src.embeddings.sketches import ValueSketcher
+from src.embeddings.profiling import ColumnProfiler
+from src.embeddings.quantization import ProductQuantizer
 
 if __name__ == '__main__':
     args = sys.argv
     print(f'Started with process arg "{args[1]}"')
     process_arg = args[1].lower()
+    quantizer = ProductQuantizer(INDEX_PQ_SUBVECTORS) \
+        if INDEX_PQ_SUBVECTORS else None
     if process_arg == 'generate':
         print('Generate fake data.')
         generate_data(save_dir_path='test_data',
@@ -17,15 +31,75 @@ if __name__ == '__main__':
                       random_queris=3,
                       table_per_query=15
                       )
+    if process_arg == 'generate_benchmark':
+        # python main.py generate_benchmark [TABLES] [ROWS] [WORKERS]
+        print('Generate offline benchmark data with ground truth.')
+        tables = int(args[2]) if len(args) > 2 else 100
+        rows = int(args[3]) if len(args) > 3 else 1000
+        workers = int(args[4]) if len(args) > 4 else 1
+        generate_benchmark_data(save_dir_path=BENCHMARK_DATA_DIR,
+                                tables=tables,
+                                row_min=rows,
+                                row_max=rows,
+                                workers=workers,
+                                ground_truth_pth=GROUND_TRUTH_PTH)
     if process_arg == 'train_ft_one_elem':
         print('Train FastText on elements of data.')
-        model = FastTextOneElement(DATA_DIR)
-        model.train(epochs=5000)
+        compile_corpus(DATA_DIR, CORPUS_PTH)
+        model = FastTextOneElement(DATA_DIR, corpus_file=CORPUS_PTH)
+        # 5000 epochs of one cell per column (old DataLoader epochs)
+        model.train(column_epochs=5000)
+    if process_arg == 'compile_corpus':
+        print('Compile cells of data to corpus file.')
+        compile_corpus(DATA_DIR, CORPUS_PTH, force=True)
 
     if process_arg == 'disitersect_test':
         print('Delete intesect folders in test_data.')
         disintersect_folders(check_intersectoin_path='data',
                              source_path='test_data')
+    if process_arg == 'build_index':
+        # python main.py build_index MODEL_PTH [WORKERS]
+        print('Build embeddings index of data.')
+        workers = int(args[3]) if len(args) > 3 else None
+        sketcher = ValueSketcher() if INDEX_SKETCHES else None
+        profiler = ColumnProfiler() if INDEX_PROFILES else None
+        manifest = build_manifest(args[2], DATA_DIR, sketcher, profiler)
+        embeddings = build_index(args[2], DATA_DIR, workers=workers,
+                                 sketcher=sketcher, profiler=profiler)
+        save_index(embeddings, INDEX_DIR, sketcher, INDEX_VECTORS_DTYPE,
+                   quantizer)
+        # later update_index embeds only files changed after this build
+        save_manifest(manifest)
+    if process_arg == 'update_index':
+        # python main.py update_index MODEL_PTH [WORKERS]
+        print('Update embeddings index of data (only changed files).')
+        workers = int(args[3]) if len(args) > 3 else None
+        update_index(args[2], DATA_DIR, workers=workers,
+                     sketcher=ValueSketcher() if INDEX_SKETCHES else None,
+                     profiler=ColumnProfiler() if INDEX_PROFILES else None,
+                     dtype=INDEX_VECTORS_DTYPE, quantizer=quantizer)
+    if process_arg == 'compress_index':
+        # python main.py compress_index
+        # storage is set only in config (INDEX_VECTORS_DTYPE,
+        # INDEX_PQ_SUBVECTORS): build_index and update_index rewrite the
+        # index with it too, so it is not undone by the next update
+        print(f'Rewrite index with {INDEX_VECTORS_DTYPE} vectors and '
+              f'{INDEX_PQ_SUBVECTORS} bytes PQ codes (config).')
+        index = ColumnsIndex.load(INDEX_DIR)
+        save_index(list(index), INDEX_DIR,
+                   ValueSketcher(**index.sketch_params)
+                   if index.sketch_params else None, INDEX_VECTORS_DTYPE,
+                   quantizer)
+    if process_arg == 'convert_index':
+        print(f'Convert {EMBEDDINGS_PTH} to columnar index.')
+        convert_pickle_index(EMBEDDINGS_PTH, INDEX_DIR)
     if process_arg == 'raise_server':
-        print('Raise server')
-        raise_server()
+        # python main.py raise_server [prod [WORKERS]]
+        if len(args) > 2 and args[2] == 'prod':
+            from src.inference.production import serve
+            workers = int(args[3]) if len(args) > 3 else None
+            print('Raise production server')
+            serve(workers=workers)
+        else:
+            print('Raise server')
+            raise_server()
@@ -0,0 +1,62 @@
+"""Compile csv cells to gensim corpus_file (one cell per line)."""
+import json
+import os
+from src.data_process.data_classes import CellSentence
+
+
+def files_state(data_dir: str) -> list[list]:
+    """Sorted [path, size, mtime] of csv files of data_dir."""
+    state = []
+    for address, dirs, files in os.walk(data_dir):
+        for name in files:
+            file_pth = os.path.join(address, name)
+            if file_pth[-4:] == '.csv':
+                stat = os.stat(file_pth)
+                state.append([file_pth, stat.st_size, stat.st_mtime_ns])
+    return sorted(state)
+
+
+def is_corpus_stale(data_dir: str, corpus_pth: str) -> bool:
+    """
+    Corpus is stale if it or its files list is absent, or csv files of
+    data_dir were added, deleted or changed (size or mtime) since it was
+    compiled.
+    """
+    files_pth = corpus_pth + '.files.json'
+    if not os.path.exists(corpus_pth) or not os.path.exists(files_pth):
+        return True
+    with open(files_pth) as f:
+        return json.load(f) != files_state(data_dir)
+
+
+def compile_corpus(data_dir: str, corpus_pth: str,
+                   force: bool = False) -> str:
+    """
+    Tokenize all cells of data_dir to corpus_pth in LineSentence format.
+
+    Tokens of one cell are one line, empty cells are skipped. The file
+    feeds FastText.build_vocab/train(corpus_file=...), where every
+    worker reads its own part of file, without python csv parsing.
+    Corpus is rebuilt only if force or it is stale: compiled files are
+    saved to corpus_pth + '.files.json'.
+    """
+    if not force and not is_corpus_stale(data_dir, corpus_pth):
+        print(f'Corpus {corpus_pth} is up to date.')
+        return corpus_pth
+    corpus_dir = os.path.dirname(corpus_pth)
+    if corpus_dir:
+        os.makedirs(corpus_dir, exist_ok=True)
+    # state before reading: file changed meanwhile makes corpus stale
+    state = files_state(data_dir)
+    lines = 0
+    with open(corpus_pth + '.tmp', 'w', encoding='utf-8') as f:
+        for sentence in CellSentence(data_dir):
+            if sentence:
+                f.write(' '.join(sentence))
+                f.write('\n')
+                lines += 1
+    os.replace(corpus_pth + '.tmp', corpus_pth)
+    with open(corpus_pth + '.files.json', 'w') as f:
+        json.dump(state, f, indent=1)
+    print(f'Corpus of {lines} cells saved to {corpus_pth}')
+    return corpus_pth
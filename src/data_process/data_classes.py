@@ -3,8 +3,14 @@ import os
 import csv
 from torch.utils.data import Dataset
 from collections import namedtuple
+from collections import OrderedDict
 from typing import List
+import io
+import mmap
+import random
 import numpy as np
+from config import ROW_INDEX_DIR
+from src.data_process.row_index import load_row_offsets, open_mmap
 
 
 def get_csv_len(csv_path: str):
@@ -78,137 +84,205 @@ class AllCsvDataSet(Dataset):
     Item is one of element in some row of col of some dataset.
 
     В отличие от DirectIterationDataset честно считывает данные,
-    перемешивая их. Но __getitem__ работает за O(N).
+    перемешивая их. Для каждого файла строится (и кэшируется на диске)
+    индекс байтовых смещений строк, поэтому __getitem__ -- бинарный поиск
+    по накопленным размерам файлов и одно чтение из mmap файла.
+    Items of file are ordered by columns: (col 0, rows...), (col 1, ...).
     """
-    def __init__(self, data_dir, return_row=False):
+    def __init__(self, data_dir, return_row=False,
+                 cache_dir: str | None = ROW_INDEX_DIR,
+                 max_open_files: int = 64):
         self.data_dir = data_dir
-
-        self._index_map = []
-        # can we do it faster (with map)
-        # but we need memory control.
-
-        self._all_rows_len = 0
         self.return_row = return_row
-        self._all_len = 0
+        self.cache_dir = cache_dir
+        self.max_open_files = max_open_files
+        self._mmaps: OrderedDict[int, mmap.mmap] = OrderedDict()
+
+        self._files = []
+        self._offsets = []
+        self._rows_count = []
+        self._cols_count = []
         for address, dirs, files in os.walk(self.data_dir):
             for name in files:
                 file_pth = os.path.join(address, name)
                 if file_pth[-4:] == '.csv':
-                    file_len, header = get_csv_len(file_pth)
-                    self._all_rows_len += file_len
-                    self._all_len += file_len * len(header)
-                    self._index_map.append((
-                        self._all_len,
-                        file_pth,
-                        file_len
-                    ))
+                    offsets = load_row_offsets(file_pth, cache_dir)
+                    if len(offsets) < 2:
+                        continue  # empty file, no header
+                    self._files.append(file_pth)
+                    self._offsets.append(offsets[1:])  # skip header
+                    self._rows_count.append(len(offsets) - 2)
+                    self._cols_count.append(len(self._read_record(
+                        len(self._files) - 1, offsets[0], offsets[1])))
+        self._rows_count = np.array(self._rows_count, dtype=np.int64)
+        items_count = self._rows_count if return_row else \
+            self._rows_count * np.array(self._cols_count, dtype=np.int64)
+        # first item index of every file (+ total len)
+        self._accum_items = np.concatenate([[0], np.cumsum(items_count)])
 
     def __len__(self):
-        if self.return_row:
-            return self._all_rows_len
-        return self._all_len
+        return int(self._accum_items[-1])
+
+    def _get_mmap(self, file_id: int):
+        """Get memory-mapped file, keep no more than max_open_files."""
+        if file_id in self._mmaps:
+            self._mmaps.move_to_end(file_id)
+            return self._mmaps[file_id]
+        if len(self._mmaps) >= self.max_open_files:
+            _, old = self._mmaps.popitem(last=False)
+            if isinstance(old, mmap.mmap):
+                old.close()
+        self._mmaps[file_id] = open_mmap(self._files[file_id])
+        return self._mmaps[file_id]
+
+    def _read_record(self, file_id: int, start: int, end: int) -> list:
+        """Parse one csv record of file from bytes start:end."""
+        record = self._get_mmap(file_id)[start:end].decode()
+        return next(csv.reader([record]), [])
 
     def __getitem__(self, idx):
-        # it must be sorted for el[0]
-        for i in range(len(self._index_map)):
-            el = self._index_map[i]
-            if idx < el[0]:
-                file_path = el[1]
-                file_len = el[2]
-                index = idx
-                if i > 0:
-                    index = idx - self._index_map[i-1][0]
-                len_now = 0
-                col = 0
-                while len_now < index:
-                    len_now += file_len
-                    col += 1
-                if col:
-                    col -= 1
-                index -= col * file_len
-                res = get_csv_row_on_ind(file_path, index)
-                if self.return_row:
-                    return res
-                return res[col]
-        raise Exception('getitem returned None')
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Index {idx} out of range')
+        file_id = int(np.searchsorted(self._accum_items, idx,
+                                      side='right')) - 1
+        index = idx - self._accum_items[file_id]
+        col, row = divmod(int(index), int(self._rows_count[file_id]))
+        offsets = self._offsets[file_id]
+        res = self._read_record(file_id, offsets[row], offsets[row + 1])
+        if self.return_row:
+            return res
+        return res[col]
+
+    def __getstate__(self):
+        # mmaps can't be pickled (DataLoader workers), reopen lazily
+        state = self.__dict__.copy()
+        state['_mmaps'] = OrderedDict()
+        return state
 
 
 class DirectIterationDataset(Dataset):
     """
     Датасет, который читает данные в колонках подряд.
 
-    Для каждой таблицы создает свой ридер. И построчно, сверху вниз, считывает
-    данные. В таком случае getitem работает за O(кол-во таблиц) (с учетом,
-    векторых операций, может и за O(1), но данные для обучения
-    не перемешиваются.
+    Для каждой таблицы хранится позиция ридера, и данные построчно, сверху
+    вниз, считываются. Открыто не больше max_open_files файлов (LRU пул),
+    закрытый ридер лениво переоткрывается с нужной строки по индексу
+    смещений строк. getitem -- бинарный поиск по accum_cols_count, но
+    данные для обучения не перемешиваются.
     """
     FileCsvReader = namedtuple('FileCsvReader', 'file, file_pth, reader')
-    # IterMonitor = namedtuple('IterMonitor', 'iteration, len')
 
-    def __init__(self, data_dir, return_row=False):
+    def __init__(self, data_dir, return_row=False,
+                 max_open_files: int = 256,
+                 cache_dir: str | None = ROW_INDEX_DIR):
         self.data_dir = data_dir
+        self.max_open_files = max_open_files
+        self.cache_dir = cache_dir
 
-        self._readers: List[self.FileCsvReader] = []
-        self._last_rows = []
-        self.accum_cols_count = [0]
+        self._files = []
+        cols_count = []
         for address, dirs, files in os.walk(self.data_dir):
             for name in files:
                 file_pth = os.path.join(address, name)
                 if file_pth[-4:] == '.csv':
-                    file = open(file_pth)
                     try:
-                        reader = csv.reader(file)
-                        header = next(reader)
-                    except UnicodeDecodeError:
+                        with open(file_pth) as file:
+                            header = next(csv.reader(file))
+                    except (UnicodeDecodeError, StopIteration):
                         print(f'Bad symbol in {file_pth}.')
                         continue
-                    self.accum_cols_count.append(self.accum_cols_count[-1] +
-                                                 len(header))
-                    self._last_rows.append(header)
-
-                    new_elem = self.FileCsvReader(file=file, reader=reader,
-                                                  file_pth=file_pth)
-                    self._readers.append(new_elem)
-        self._readed = [
-            np.array(
-                [True] * (
-                    self.accum_cols_count[i] - self.accum_cols_count[i-1]
-                    )
-            ) for i in range(1, len(self.accum_cols_count))
-            ]
-        self._iter_table_map = {}
-        now_iter = 0
-        for i in range(1, len(self.accum_cols_count)):
-            for j in range(self.accum_cols_count[i] -
-                           self.accum_cols_count[i-1]):
-                self._iter_table_map[now_iter+j] = i - 1
-            now_iter += self.accum_cols_count[i] - self.accum_cols_count[i-1]
-        self.accum_cols_count.pop(0)
-        self._len = sum([len(el) for el in self._readed])
+                    self._files.append(file_pth)
+                    cols_count.append(len(header))
+        self._cols_count = np.array(cols_count, dtype=np.int64)
+        # end (exclusive) of every table in items
+        self.accum_cols_count = np.cumsum(self._cols_count)
+        self._starts = self.accum_cols_count - self._cols_count
+        self._len = int(self.accum_cols_count[-1]) if cols_count else 0
+        # all cells are read: first access of table reads its first row
+        self._readed = np.ones(self._len, dtype=bool)
+        self._readed_count = self._cols_count.copy()
+        self._rows_pos = np.zeros(len(self._files), dtype=np.int64)
+        self._last_rows: List[list | None] = [None] * len(self._files)
+        self._readers: OrderedDict[int, self.FileCsvReader] = OrderedDict()
 
     def __len__(self):
         # if one iterate over dataset = iterate over all columns once
         return self._len
 
+    def _get_reader(self, table_id: int) -> 'FileCsvReader':
+        """Get reader of table from pool, (re)open it at saved position."""
+        if table_id in self._readers:
+            self._readers.move_to_end(table_id)
+            return self._readers[table_id]
+        if len(self._readers) >= self.max_open_files:
+            _, old = self._readers.popitem(last=False)
+            old.file.close()
+        file_pth = self._files[table_id]
+        rows_pos = int(self._rows_pos[table_id])
+        if rows_pos == 0:
+            file = open(file_pth)
+            reader = csv.reader(file)
+            next(reader, None)  # skip header
+        else:
+            offsets = load_row_offsets(file_pth, self.cache_dir)
+            binary = open(file_pth, 'rb')
+            # offsets[0] is header, data row i starts at offsets[i + 1]
+            binary.seek(int(offsets[rows_pos + 1]))
+            file = io.TextIOWrapper(binary)
+            reader = csv.reader(file)
+        self._readers[table_id] = self.FileCsvReader(
+            file=file, file_pth=file_pth, reader=reader)
+        return self._readers[table_id]
+
+    def _close_reader(self, table_id: int):
+        """Close reader of table if it is open."""
+        reader = self._readers.pop(table_id, None)
+        if reader is not None:
+            reader.file.close()
+
+    def _next_row(self, table_id: int) -> list:
+        """Read next row with right cells count, start again at the end."""
+        n_cols = self._cols_count[table_id]
+        for _ in range(2):
+            reader = self._get_reader(table_id).reader
+            try:
+                for row in reader:
+                    self._rows_pos[table_id] += 1
+                    if len(row) == n_cols:
+                        return row
+            except UnicodeDecodeError:
+                print(f'Bad symbol in {self._files[table_id]}.')
+            self._close_reader(table_id)
+            self._rows_pos[table_id] = 0
+        return [''] * n_cols  # table without good rows
+
     def __getitem__(self, idx):
-        table_id = self._iter_table_map[idx]
-        col_ind = idx - self.accum_cols_count[table_id]
-        file, file_pth, reader = self._readers[table_id]
-        if self._readed[table_id][col_ind] is True:
-            if np.all(self._readed[table_id]):
-                try:
-                    self._last_rows[table_id] = next(reader)
-                except StopIteration:
-                    file.close()
-                    file = open(file_pth)
-                    reader = csv.reader(file)
-                    next(reader)  # skip header
-                    self._last_rows[table_id] = next(reader)
-                finally:
-                    self._readed[table_id].fill(False)
-        rt_elem = self._last_rows[table_id][col_ind]
-        self._readed[table_id][col_ind] = True
-        return rt_elem.split()
+        table_id = int(np.searchsorted(self.accum_cols_count, idx,
+                                       side='right'))
+        start = self._starts[table_id]
+        col_ind = idx - start
+        if self._readed[idx]:
+            if self._readed_count[table_id] == self._cols_count[table_id]:
+                self._last_rows[table_id] = self._next_row(table_id)
+                self._readed[start:self.accum_cols_count[table_id]] = False
+                self._readed_count[table_id] = 0
+        if not self._readed[idx]:
+            self._readed[idx] = True
+            self._readed_count[table_id] += 1
+        return self._last_rows[table_id][col_ind].split()
+
+    def close(self):
+        """Close all open files."""
+        for table_id in list(self._readers):
+            self._close_reader(table_id)
+
+    def __getstate__(self):
+        # open files can't be pickled (DataLoader workers), reopen lazily
+        state = self.__dict__.copy()
+        state['_readers'] = OrderedDict()
+        return state
 
 
 class CellSentence(object):
@@ -238,3 +312,39 @@ class CellSentence(object):
                                 line = next(reader, None)
                             except UnicodeDecodeError:
                                 print(f'Bad symbol in {file_pth}.')
+                                line = None  # rest of file is skipped
+
+
+class ShuffledCellSentences(object):
+    """
+    Cells as sentences (like CellSentence), shuffled by bounded buffer.
+
+    Streams cells file by file and yields them through a shuffle buffer of
+    buffer_size sentences, so memory does not depend on data size. Can be
+    iterated many times (gensim epochs), every pass has its own order.
+    Feeds gensim directly: total_examples is corpus_count of
+    build_vocab(CellSentence(data_dir)).
+    """
+
+    def __init__(self, data_dir, buffer_size: int = 100000,
+                 seed: int | None = 42):
+        self.data_dir = data_dir
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self._epoch = 0
+
+    def __iter__(self):
+        """Iterate over shuffled cells (one cell = list of tokens)."""
+        seed = None if self.seed is None else self.seed + self._epoch
+        self._epoch += 1
+        rng = random.Random(seed)
+        buffer = []
+        for sentence in CellSentence(self.data_dir):
+            if len(buffer) < self.buffer_size:
+                buffer.append(sentence)
+                continue
+            ind = rng.randrange(self.buffer_size)
+            yield buffer[ind]
+            buffer[ind] = sentence
+        rng.shuffle(buffer)
+        yield from buffer
@@ -0,0 +1,78 @@
+"""Byte offsets of csv rows for random access (cached on disk)."""
+import hashlib
+import mmap
+import os
+import numpy as np
+from config import ROW_INDEX_DIR
+
+BLOCK_SIZE = 64 * 1024 ** 2
+NEWLINE = ord('\n')
+QUOTE = ord('"')
+
+
+def build_row_offsets(csv_path: str, block_size: int = BLOCK_SIZE
+                      ) -> np.ndarray:
+    """
+    Get start offsets of all csv records and the end of file.
+
+    Record i is bytes offsets[i]:offsets[i+1] (record 0 is header).
+    Newlines inside quoted cells are skipped by quotes parity ("" escape
+    keeps parity). File is scanned by blocks with numpy.
+    """
+    size = os.path.getsize(csv_path)
+    ends = []
+    quotes_parity = 0
+    with open(csv_path, 'rb') as f:
+        start = 0
+        while start < size:
+            block = np.frombuffer(f.read(block_size), dtype=np.uint8)
+            quotes = np.flatnonzero(block == QUOTE)
+            newlines = np.flatnonzero(block == NEWLINE)
+            parity = (np.searchsorted(quotes, newlines) + quotes_parity) % 2
+            ends.append(newlines[parity == 0] + start)
+            quotes_parity = (quotes_parity + len(quotes)) % 2
+            start += len(block)
+    ends = np.concatenate(ends) if ends else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate([[0], ends + 1]).astype(np.int64)
+    if starts[-1] < size:
+        # last record without trailing newline
+        starts = np.append(starts, size)
+    return starts
+
+
+def _cache_pth(csv_path: str, cache_dir: str) -> str:
+    """Path of cached offsets of csv_path."""
+    name = hashlib.blake2b(os.path.abspath(csv_path).encode(),
+                           digest_size=16).hexdigest()
+    return os.path.join(cache_dir, name + '.npz')
+
+
+def load_row_offsets(csv_path: str, cache_dir: str | None = ROW_INDEX_DIR
+                     ) -> np.ndarray:
+    """
+    Get row offsets of csv_path from cache, build and cache if stale.
+
+    Cache is valid while size and mtime of csv file are the same.
+    cache_dir=None disables disk cache.
+    """
+    stat = os.stat(csv_path)
+    state = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cache_pth = _cache_pth(csv_path, cache_dir) if cache_dir else None
+    if cache_pth and os.path.exists(cache_pth):
+        with np.load(cache_pth) as cached:
+            if np.array_equal(cached['state'], state):
+                return cached['offsets']
+    offsets = build_row_offsets(csv_path)
+    if cache_pth:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(cache_pth + '.tmp.npz', offsets=offsets, state=state)
+        os.replace(cache_pth + '.tmp.npz', cache_pth)
+    return offsets
+
+
+def open_mmap(csv_path: str) -> mmap.mmap | bytes:
+    """Memory-map csv file for reading (empty file can't be mapped)."""
+    with open(csv_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -1,10 +1,11 @@
 """Fasttext model learning on elements of rows in dataset."""
 from gensim.models.fasttext import FastText
-from torch.utils.data import DataLoader
-from src.data_process.data_classes import DirectIterationDataset, CellSentence
+from src.data_process.data_classes import CellSentence, ShuffledCellSentences
 from gensim.models.callbacks import CallbackAny2Vec
 from datetime import datetime
+import csv
 import os
+from src.embeddings.get_embeddins import iter_csv_files
 
 
 class LossLogger(CallbackAny2Vec):
@@ -30,19 +31,32 @@ class LossLogger(CallbackAny2Vec):
         self.loss_previous_step = loss
 
 
+def count_columns(data_dir: str) -> int:
+    """Columns of all csv tables of data_dir (only headers are read)."""
+    columns = 0
+    for file_pth in iter_csv_files(data_dir):
+        with open(file_pth, newline='') as f:
+            columns += len(next(csv.reader(f), []))
+    return columns
+
+
 class FastTextOneElement:
     """Fasttext model class. Learning on elements."""
 
-    def __init__(self, data_dir: str) -> None:
-        """data_dir -- directory with datasets."""
-        self.data_dir = data_dir
-        # dataset = AllCsvDataSet(data_dir=data_dir, return_row=False)
-        dataset = DirectIterationDataset(data_dir=data_dir, return_row=False)
-        print('Data len (number of cols):', len(dataset))
+    def __init__(self, data_dir: str, corpus_file: str | None = None,
+                 workers: int = 6, shuffle_buffer: int = 100000) -> None:
+        """
+        data_dir -- directory with datasets.
 
-        self.dataloader = DataLoader(dataset,
-                                     batch_size=1,
-                                     shuffle=True)
+        corpus_file -- compiled corpus (see src.data_process.corpus); if
+        set, vocabulary and training stream from it in gensim corpus_file
+        mode, where all workers read the file in parallel. Else cells are
+        streamed from csv through shuffle buffer of shuffle_buffer cells.
+        """
+        self.data_dir = data_dir
+        self.corpus_file = corpus_file
+        self.sentences = ShuffledCellSentences(data_dir,
+                                               buffer_size=shuffle_buffer)
 
         self.model = FastText(vector_size=256,
                               window=3,
@@ -52,22 +66,42 @@ class FastTextOneElement:
                               negative=12,
                               min_n=2,
                               max_n=4,
-                              workers=6,
+                              workers=workers,
                               min_count=0,
                               epochs=200)
 
-    def train(self, epochs: int = 150, save_dir_pth: str = 'models/'):
-        """Train and save model."""
+    def train(self, epochs: int = 150, save_dir_pth: str = 'models/',
+              column_epochs: int | None = None):
+        """
+        Train and save model.
+
+        Epoch is a pass over every cell of every table. column_epochs
+        sets the training length in epochs of the old DataLoader (one
+        cell of every column per epoch): epochs = column_epochs *
+        columns / cells (at least 1), so the model sees as many cells as
+        before.
+        """
         print('Start build vocabulary')
-        self.model.build_vocab(CellSentence(data_dir=self.data_dir))
+        if self.corpus_file is not None:
+            self.model.build_vocab(corpus_file=self.corpus_file)
+            corpus = {'corpus_file': self.corpus_file,
+                      'total_words': self.model.corpus_total_words}
+        else:
+            self.model.build_vocab(CellSentence(data_dir=self.data_dir))
+            corpus = {'corpus_iterable': self.sentences,
+                      'total_examples': self.model.corpus_count}
         print('Corpus count:', self.model.corpus_count)
         print('Corpus total words:', self.model.corpus_total_words)
         print('Total words vectors len:', len(self.model.wv))
-        print('Dataloader len:', len(self.dataloader))
+        if column_epochs is not None:
+            columns = count_columns(self.data_dir)
+            epochs = max(1, round(column_epochs * columns /
+                                  max(self.model.corpus_count, 1)))
+            print(f'{column_epochs} epochs over {columns} columns are '
+                  f'{epochs} epochs over all cells')
         try:
             self.model.train(
-                corpus_iterable=self.dataloader,
-                total_examples=len(self.dataloader),
+                **corpus,
                 epochs=epochs,
                 compute_loss=True,
                 callbacks=[LossLogger()]
@@ -0,0 +1,148 @@
+"""Batched column embeddings: vectorized FastText lookups over row chunks."""
+import numpy as np
+from scipy import sparse
+from gensim.models.fasttext import ft_ngram_hashes
+from src.monitoring.metrics import count, stage
+
+
+def lookup_vectors(wv, tokens: list[str]) -> np.ndarray:
+    """
+    Get FastText vectors for unique tokens in one vectorized pass.
+
+    Same result as model.wv.get_vector for every token: in-vocabulary
+    tokens are gathered from wv.vectors, OOV tokens are the mean of
+    their char n-gram vectors (zero vector if there are no n-grams).
+    Args:
+        wv: FastTextKeyedVectors of the model.
+        tokens (list[str]): tokens, preferably unique.
+
+    Returns:
+        np.ndarray: matrix len(tokens) x wv.vector_size.
+    """
+    vectors = np.zeros((len(tokens), wv.vector_size),
+                       dtype=wv.vectors.dtype)
+    key_to_index = wv.key_to_index
+    vocab_pos, vocab_ids = [], []
+    oov_pos, oov_offsets, ngram_hashes = [], [], []
+    for pos, token in enumerate(tokens):
+        ind = key_to_index.get(token)
+        if ind is not None:
+            vocab_pos.append(pos)
+            vocab_ids.append(ind)
+            continue
+        if wv.bucket == 0:
+            raise KeyError('cannot calculate vector for OOV word '
+                           'without ngrams')
+        hashes = ft_ngram_hashes(token, wv.min_n, wv.max_n, wv.bucket)
+        if hashes:
+            oov_pos.append(pos)
+            oov_offsets.append(len(ngram_hashes))
+            ngram_hashes.extend(hashes)
+    if vocab_pos:
+        vectors[vocab_pos] = wv.vectors[vocab_ids]
+    if oov_pos:
+        # sparse (oov tokens x buckets) averaging matrix: no gathered copy
+        # of n-gram vectors is materialized
+        indptr = np.append(oov_offsets, len(ngram_hashes))
+        counts = np.diff(indptr)
+        averaging = sparse.csr_matrix(
+            (np.repeat(1.0 / counts, counts).astype(vectors.dtype),
+             ngram_hashes, indptr),
+            shape=(len(oov_pos), wv.bucket)
+            )
+        vectors[oov_pos] = averaging @ wv.vectors_ngrams
+    return vectors
+
+
+class ColumnsAccumulator:
+    """
+    Running sums of cell embeddings for every column of one table.
+
+    Rows are fed by chunks. Cell vector is the sum of its token vectors
+    divided by the squared token count, column embedding is the sum of
+    cell vectors divided by the number of rows (as in the original
+    per-cell loop of get_columns_embeddings).
+    """
+
+    def __init__(self, wv, header: list[str], cache=None, sketches=None,
+                 profile=None):
+        """
+        Init accumulator for table with columns header.
+
+        cache -- optional TokenVectorCache over wv used for lookups.
+        sketches, profile -- optional TableSketches and TableProfile
+        updated with the same rows.
+        """
+        self.wv = wv
+        self.cache = cache
+        self.sketches = sketches
+        self.profile = profile
+        self.header = header
+        self.n_cols = len(header)
+        self.rows_count = 0
+        self.bad_rows_count = 0
+        self._sums = np.zeros((self.n_cols, wv.vector_size),
+                              dtype=np.float64)
+
+    def update(self, rows: list[list[str]]):
+        """Add chunk of rows. Rows with wrong cells count are skipped."""
+        good_rows = [row for row in rows if len(row) == self.n_cols]
+        self.bad_rows_count += len(rows) - len(good_rows)
+        rows = good_rows
+        if not rows:
+            return
+        self.rows_count += len(rows)
+        count('rows', len(rows))
+        if self.sketches is not None:
+            with stage('sketch'):
+                self.sketches.update(rows)
+        if self.profile is not None:
+            with stage('profile'):
+                self.profile.update(rows)
+        with stage('tokenize'):
+            tokens_index = {}
+            token_ids, tokens_count = [], []
+            for i in range(self.n_cols):
+                for row in rows:
+                    cell_tokens = row[i].split()
+                    tokens_count.append(len(cell_tokens))
+                    token_ids.extend(tokens_index.setdefault(
+                        token, len(tokens_index)) for token in cell_tokens)
+        if not token_ids:
+            return
+        count('tokens', len(tokens_index))
+        with stage('token_lookup'):
+            if self.cache is not None:
+                vectors = self.cache.get_vectors(list(tokens_index))
+            else:
+                vectors = lookup_vectors(self.wv, list(tokens_index))
+        with stage('aggregate'):
+            tokens_count = np.array(tokens_count, dtype=np.int64)
+            cell_weights = np.zeros(len(tokens_count), dtype=np.float64)
+            not_empty = tokens_count > 0
+            cell_weights[not_empty] = 1.0 / tokens_count[not_empty] ** 2
+            cell_cols = np.repeat(np.arange(self.n_cols), len(rows))
+            # sparse weights of (column, unique token) pairs (repeated
+            # pairs are summed), then one matmul linear in token count
+            weights = sparse.csr_matrix(
+                (np.repeat(cell_weights, tokens_count),
+                 (np.repeat(cell_cols, tokens_count),
+                  np.array(token_ids, dtype=np.int64))),
+                shape=(self.n_cols, len(tokens_index)))
+            self._sums += weights @ vectors
+
+    def means(self) -> np.ndarray:
+        """Get current column embeddings matrix (columns x vector_size)."""
+        return self._sums / max(self.rows_count, 1)
+
+    def embeddings(self) -> dict[str, np.ndarray]:
+        """Get not zero column embeddings in {col_name: embedding} format."""
+        res = {}
+        if self.rows_count == 0:
+            return res
+        means = self.means().astype(self.wv.vectors.dtype)
+        for col_name, embedding in zip(self.header, means):
+            if np.all(embedding == 0):
+                continue
+            res[col_name] = embedding
+        return res
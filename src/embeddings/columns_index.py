@@ -0,0 +1,246 @@
+"""
+On-disk columnar index of column embeddings.
+
+Index directory contains:
+    vectors.npy -- float32 or float16 matrix (columns x dim), opened with
+        np.memmap;
+    meta.json -- files list and (file id, col name) of every row;
+    minhash.npy, hll.npy -- optional value sketches of every row (params
+        of sketcher are in meta.json);
+    profile.npy -- optional PROFILE_STATS of every row (types and row
+        ranges of every type are in meta.json, rows are grouped by type);
+    pq_codebooks.npy, pq_codes.npy -- optional product quantization of
+        vectors (params are in meta.json).
+"""
+import json
+import os
+import pickle
+from typing import Iterator
+import numpy as np
+from src.embeddings.get_embeddins import ColEmbedding
+from src.embeddings.profiling import (COLUMN_TYPES, PROFILE_STATS,
+                                      ColumnProfile)
+from src.embeddings.quantization import ProductQuantizer
+
+VECTORS_FILE = 'vectors.npy'
+META_FILE = 'meta.json'
+MINHASH_FILE = 'minhash.npy'
+HLL_FILE = 'hll.npy'
+PROFILE_FILE = 'profile.npy'
+PQ_CODEBOOKS_FILE = 'pq_codebooks.npy'
+PQ_CODES_FILE = 'pq_codes.npy'
+
+
+class ColumnsIndex:
+    """Embeddings matrix with file_pth/col_name of every row."""
+
+    def __init__(self, vectors: np.ndarray, files: list[str],
+                 file_ids: np.ndarray, col_names: list[str],
+                 minhashes: np.ndarray | None = None,
+                 hlls: np.ndarray | None = None,
+                 sketch_params: dict | None = None,
+                 col_types: list[str] | None = None,
+                 profiles: np.ndarray | None = None,
+                 pq_codebooks: np.ndarray | None = None,
+                 pq_codes: np.ndarray | None = None,
+                 partitions: dict[str, tuple[int, int]] | None = None):
+        """
+        Init index. vectors[i] is embedding of files[file_ids[i]].
+
+        minhashes, hlls -- optional value sketches matrices, sketch_params
+        -- params of ValueSketcher they were computed with.
+        col_types, profiles -- optional types and PROFILE_STATS matrix.
+        pq_codebooks, pq_codes -- optional product quantization of vectors.
+        partitions -- optional (start, end) rows of every column type.
+        """
+        if len(vectors) != len(file_ids) or len(vectors) != len(col_names):
+            raise ValueError('Vectors and metadata have different length: '
+                             f'{len(vectors)}, {len(file_ids)}, '
+                             f'{len(col_names)}')
+        self.vectors = vectors
+        self.files = files
+        self.file_ids = file_ids
+        self.col_names = col_names
+        self.minhashes = minhashes
+        self.hlls = hlls
+        self.sketch_params = sketch_params
+        self.col_types = col_types
+        self.profiles = profiles
+        self.pq_codebooks = pq_codebooks
+        self.pq_codes = pq_codes
+        self.partitions = partitions
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __getitem__(self, ind: int) -> 'ColEmbedding':
+        return ColEmbedding(file_pth=self.files[self.file_ids[ind]],
+                            col_name=self.col_names[ind],
+                            embedding=self.vectors[ind],
+                            minhash=None if self.minhashes is None
+                            else self.minhashes[ind],
+                            hll=None if self.hlls is None
+                            else self.hlls[ind],
+                            profile=None if self.col_types is None
+                            else ColumnProfile(self.col_types[ind],
+                                               *self.profiles[ind]))
+
+    def __iter__(self) -> Iterator['ColEmbedding']:
+        for ind in range(len(self)):
+            yield self[ind]
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> 'ColumnsIndex':
+        """Open index from index_dir. Matrices are memory-mapped if mmap."""
+        mmap_mode = 'r' if mmap else None
+        vectors = np.load(os.path.join(index_dir, VECTORS_FILE),
+                          mmap_mode=mmap_mode)
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            meta = json.load(f)
+        sketch_params = meta.get('sketch_params')
+        minhashes = hlls = None
+        if sketch_params is not None:
+            minhashes = np.load(os.path.join(index_dir, MINHASH_FILE),
+                                mmap_mode=mmap_mode)
+            hlls = np.load(os.path.join(index_dir, HLL_FILE),
+                           mmap_mode=mmap_mode)
+        col_types = meta.get('col_types')
+        profiles = partitions = None
+        if col_types is not None:
+            profiles = np.load(os.path.join(index_dir, PROFILE_FILE))
+            partitions = meta.get('partitions') or \
+                type_partitions(col_types)
+            if partitions is not None:
+                partitions = {col_type: tuple(rows)
+                              for col_type, rows in partitions.items()}
+        pq_codebooks = pq_codes = None
+        if meta.get('pq') is not None:
+            pq_codebooks = np.load(os.path.join(index_dir,
+                                                PQ_CODEBOOKS_FILE))
+            pq_codes = np.load(os.path.join(index_dir, PQ_CODES_FILE),
+                               mmap_mode=mmap_mode)
+        return cls(vectors, meta['files'],
+                   np.array(meta['file_ids'], dtype=np.int32),
+                   meta['col_names'], minhashes, hlls, sketch_params,
+                   col_types, profiles, pq_codebooks, pq_codes, partitions)
+
+
+def type_partitions(col_types: list[str]
+                    ) -> dict[str, tuple[int, int]] | None:
+    """(start, end) rows of every type, None if rows are not grouped."""
+    partitions = {}
+    for ind, col_type in enumerate(col_types):
+        if col_type not in partitions:
+            partitions[col_type] = [ind, ind]
+        elif partitions[col_type][1] != ind:
+            return None
+        partitions[col_type][1] = ind + 1
+    return {col_type: tuple(rows) for col_type, rows in partitions.items()}
+
+
+def _type_order(emb: 'ColEmbedding') -> int:
+    """Position of type of embedding in COLUMN_TYPES (unknown are last)."""
+    col_type = emb.profile.col_type
+    return COLUMN_TYPES.index(col_type) if col_type in COLUMN_TYPES \
+        else len(COLUMN_TYPES)
+
+
+def _files_table(embeddings) -> tuple[list[str], np.ndarray]:
+    """Get unique files and file id of every embedding."""
+    files_ind = {}
+    file_ids = np.array([files_ind.setdefault(emb.file_pth, len(files_ind))
+                         for emb in embeddings], dtype=np.int32)
+    return list(files_ind), file_ids
+
+
+def _write_matrix(pth: str, rows, dtype, width: int):
+    """Write rows to memory-mapped .npy without second copy in memory."""
+    matrix = np.lib.format.open_memmap(pth, mode='w+', dtype=dtype,
+                                       shape=(len(rows), width))
+    for i, row in enumerate(rows):
+        matrix[i] = row
+    matrix.flush()
+
+
+def _save_array(pth: str, array: np.ndarray):
+    """np.save to exact pth (np.save adds .npy to other names)."""
+    with open(pth, 'wb') as f:
+        np.save(f, array)
+
+
+def save_columns_index(embeddings: list['ColEmbedding'], index_dir: str,
+                       sketch_params: dict | None = None,
+                       dtype=np.float32,
+                       quantizer: ProductQuantizer | None = None):
+    """
+    Write embeddings to index_dir in columnar format.
+
+    Rows are written straight to the memory-mapped .npy (no second copy
+    of the matrix). Files are replaced atomically, so a server which has
+    the old index opened keeps reading it. Sketches are saved if
+    sketch_params are given and every embedding has them, profiles are
+    saved if every embedding has them.
+
+    Vectors are stored as dtype (float16 halves memory and disk). If
+    quantizer is given, it is trained on stored vectors and their PQ codes
+    are saved too.
+    With profiles rows are grouped by column type (in file order inside a
+    type): search partitions are slices of memory-mapped matrices.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    profiled = bool(embeddings) and \
+        all(emb.profile is not None for emb in embeddings)
+    if profiled:
+        embeddings = sorted(embeddings, key=_type_order)
+    dim = len(embeddings[0].embedding) if embeddings else 0
+    meta = {}
+    replace = [VECTORS_FILE]
+    vectors_pth = os.path.join(index_dir, VECTORS_FILE + '.tmp')
+    _write_matrix(vectors_pth, [emb.embedding for emb in embeddings], dtype,
+                  dim)
+    if quantizer is not None and embeddings:
+        vectors = np.load(vectors_pth, mmap_mode='r')
+        quantizer.fit(vectors)
+        _save_array(os.path.join(index_dir, PQ_CODEBOOKS_FILE + '.tmp'),
+                    quantizer.codebooks)
+        _save_array(os.path.join(index_dir, PQ_CODES_FILE + '.tmp'),
+                    quantizer.encode(vectors))
+        del vectors
+        meta['pq'] = quantizer.params()
+        replace += [PQ_CODEBOOKS_FILE, PQ_CODES_FILE]
+    if sketch_params is not None and \
+            all(emb.minhash is not None for emb in embeddings):
+        _write_matrix(os.path.join(index_dir, MINHASH_FILE + '.tmp'),
+                      [emb.minhash for emb in embeddings], np.uint64,
+                      sketch_params['num_perm'])
+        _write_matrix(os.path.join(index_dir, HLL_FILE + '.tmp'),
+                      [emb.hll for emb in embeddings], np.uint8,
+                      2 ** sketch_params['hll_p'])
+        meta['sketch_params'] = sketch_params
+        replace += [MINHASH_FILE, HLL_FILE]
+    if profiled:
+        _write_matrix(os.path.join(index_dir, PROFILE_FILE + '.tmp'),
+                      [emb.profile[1:] for emb in embeddings], np.float64,
+                      len(PROFILE_STATS))
+        meta['col_types'] = [emb.profile.col_type for emb in embeddings]
+        meta['partitions'] = type_partitions(meta['col_types'])
+        replace.append(PROFILE_FILE)
+
+    files, file_ids = _files_table(embeddings)
+    with open(os.path.join(index_dir, META_FILE + '.tmp'), 'w') as f:
+        json.dump({'files': files, 'file_ids': file_ids.tolist(),
+                   'col_names': [emb.col_name for emb in embeddings],
+                   **meta}, f)
+    # meta.json is replaced last: it tells if sketches files are valid
+    for name in replace + [META_FILE]:
+        pth = os.path.join(index_dir, name)
+        os.replace(pth + '.tmp', pth)
+
+
+def convert_pickle_index(pickle_pth: str, index_dir: str) -> 'ColumnsIndex':
+    """Convert pickled ColEmbedding list (embeddings.pkl) to index_dir."""
+    with open(pickle_pth, 'rb') as f:
+        embeddings = pickle.load(f)
+    save_columns_index(embeddings, index_dir)
+    print(f'Index of {len(embeddings)} columns converted to {index_dir}')
+    return ColumnsIndex.load(index_dir)
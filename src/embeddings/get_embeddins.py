@@ -1,50 +1,152 @@
-import numpy as np
+"""Streaming csv to column embeddings (shared by indexer and server)."""
 from collections import namedtuple
+from itertools import islice
+from typing import Iterable, Iterator
 import os
 import csv
+import numpy as np
+from src.embeddings.batch_embeddings import ColumnsAccumulator
+from src.embeddings.token_cache import TokenVectorCache
+from src.embeddings.sampling import RowSampler
+from src.embeddings.sketches import ValueSketcher
+from src.embeddings.profiling import ColumnProfiler
+from src.monitoring.metrics import stage
 
-ColEmbedding = namedtuple('ColEmbedding', 'file_pth, col_name, embedding')
+# minhash and hll are value sketches, profile is ColumnProfile (None if
+# they are not computed)
+ColEmbedding = namedtuple('ColEmbedding',
+                          'file_pth, col_name, embedding, minhash, hll, '
+                          'profile', defaults=(None, None, None))
 
+CHUNK_SIZE = 1024
 
-def get_columns_embeddings(model, data_dir) -> list['ColEmbedding']:
-    res = []
+
+def iter_csv_files(data_dir) -> Iterator[str]:
+    """Iterate over paths of csv files in data_dir."""
     for address, dirs, files in os.walk(data_dir):
         for name in files:
             file_pth = os.path.join(address, name)
             if file_pth[-4:] == '.csv':
-                with open(file_pth) as f:
-                    # TODO: выделить в отдельную функцию
-                    reader = csv.reader(f)
-                    header = next(reader, None)
-                    embeddings = {col_name: 0 for col_name in header}
-                    rows_count = 0
-                    line = next(reader, None)
-                    n_cols = len(header)
-                    while line is not None:
-                        if len(line) != n_cols:
-                            print('Count of cells != count of cols in',
-                                  file_pth)
-                            line = next(reader, None)
-                            continue
-                        rows_count += 1
-                        for i in range(n_cols):
-                            vec = 0
-                            for el in line[i].split():
-                                vec += model.wv.get_vector(el)
-                            if len(line[i].split()) == 0 or np.all(vec == 0):
-                                continue
-                            vec = vec / len(line[i].split())
-                            embeddings[header[i]] += vec / len(line[i].split())
-                        line = next(reader, None)
-                    for col_name in header:
-                        if rows_count == 0:
-                            continue
-                        embeddings[col_name] /= rows_count
-                        col_emb_tuple = ColEmbedding(file_pth=file_pth,
-                                                     col_name=col_name,
-                                                     embedding=embeddings[
-                                                         col_name])
-                        if np.all(embeddings[col_name] == 0):
-                            continue
-                        res.append(col_emb_tuple)
+                yield file_pth
+
+
+def iter_row_chunks(reader, chunk_size: int = CHUNK_SIZE
+                    ) -> Iterator[list[list[str]]]:
+    """Iterate over csv reader by lists of chunk_size rows."""
+    while True:
+        with stage('csv_parse'):
+            chunk = list(islice(reader, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def embed_csv_file(wv, file_pth: str,
+                   chunk_size: int = CHUNK_SIZE,
+                   cache: TokenVectorCache | None = None,
+                   sampler: RowSampler | None = None,
+                   sketcher: ValueSketcher | None = None,
+                   profiler: ColumnProfiler | None = None
+                   ) -> list['ColEmbedding']:
+    """
+    Get embeddings of columns of one csv file.
+
+    File is read by chunks of chunk_size rows, so memory does not depend
+    on the file size. Columns with zero embedding are skipped.
+    Args:
+        wv: FastTextKeyedVectors of the model.
+        file_pth (str): path to csv file with header.
+        chunk_size (int, optional): rows per chunk. Defaults to CHUNK_SIZE.
+        cache (TokenVectorCache, optional): token vectors cache over wv.
+            Defaults to None (no cache).
+        sampler (RowSampler, optional): rows sampling strategy (see
+            src.embeddings.sampling). Defaults to None (all rows).
+        sketcher (ValueSketcher, optional): compute MinHash and HLL of
+            columns values over the same rows. Defaults to None.
+        profiler (ColumnProfiler, optional): infer types of columns over
+            the same rows. Defaults to None.
+
+    Returns:
+        list[ColEmbedding]: embeddings of columns.
+    """
+    with open(file_pth) as f:
+        return embed_csv_lines(wv, f, file_pth, chunk_size, cache, sampler,
+                               sketcher, profiler)
+
+
+def embed_csv_lines(wv, lines: Iterable[str], file_pth: str,
+                    chunk_size: int = CHUNK_SIZE,
+                    cache: TokenVectorCache | None = None,
+                    sampler: RowSampler | None = None,
+                    sketcher: ValueSketcher | None = None,
+                    profiler: ColumnProfiler | None = None
+                    ) -> list['ColEmbedding']:
+    """
+    Same as embed_csv_file for csv lines from any source (e.g. upload).
+
+    Lines are consumed lazily: sampler which stops early stops reading.
+    file_pth is only used as name of the columns source.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return []
+    sketches = sketcher.table(len(header)) if sketcher else None
+    profile = profiler.table(len(header)) if profiler else None
+    accumulator = ColumnsAccumulator(wv, header, cache=cache,
+                                     sketches=sketches, profile=profile)
+    (sampler or RowSampler()).feed(iter_row_chunks(reader, chunk_size),
+                                   accumulator)
+    if accumulator.bad_rows_count:
+        print('Count of cells != count of cols in', file_pth)
+    # last column of the same name, as in accumulator.embeddings
+    cols_ind = {col_name: i for i, col_name in enumerate(header)}
+    res = []
+    for col_name, embedding in accumulator.embeddings().items():
+        minhash, hll = sketches.column(cols_ind[col_name]) if sketches \
+            else (None, None)
+        res.append(ColEmbedding(
+            file_pth, col_name, embedding, minhash, hll,
+            profile.column(cols_ind[col_name]) if profile else None))
+    return res
+
+
+def sketch_csv_file(file_pth: str, sketcher: ValueSketcher,
+                    chunk_size: int = CHUNK_SIZE
+                    ) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Get {col_name: (minhash, hll)} of one csv file (no embeddings)."""
+    with open(file_pth) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return {}
+        sketches = sketcher.table(len(header))
+        for chunk in iter_row_chunks(reader, chunk_size):
+            with stage('sketch'):
+                sketches.update([row for row in chunk
+                                 if len(row) == len(header)])
+    return {col_name: sketches.column(i)
+            for i, col_name in enumerate(header)}
+
+
+def get_columns_embeddings(model, data_dir,
+                           chunk_size: int = CHUNK_SIZE,
+                           cache: TokenVectorCache | None = None,
+                           sampler: RowSampler | None = None,
+                           sketcher: ValueSketcher | None = None,
+                           profiler: ColumnProfiler | None = None
+                           ) -> list['ColEmbedding']:
+    """
+    Get embeddings of all columns of csv files in data_dir.
+
+    If cache is None, new TokenVectorCache is shared by all files.
+    sampler, sketcher, profiler -- rows sampling, value sketches and
+    types of columns, see embed_csv_file.
+    """
+    if cache is None:
+        cache = TokenVectorCache(model.wv)
+    res = []
+    for file_pth in iter_csv_files(data_dir):
+        res.extend(embed_csv_file(model.wv, file_pth, chunk_size, cache,
+                                  sampler, sketcher, profiler))
     return res
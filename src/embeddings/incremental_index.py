@@ -0,0 +1,160 @@
+"""Incremental index update: re-embed only new or changed csv files."""
+from collections import namedtuple
+import hashlib
+import json
+import os
+from config import INDEX_DIR, MANIFEST_PTH
+from src.embeddings.get_embeddins import ColEmbedding, iter_csv_files
+from src.embeddings.parallel_index import embed_files, save_index
+from src.embeddings.columns_index import ColumnsIndex, META_FILE
+from src.embeddings.sketches import ValueSketcher
+from src.embeddings.profiling import ColumnProfiler
+from src.embeddings.quantization import ProductQuantizer
+
+FileState = namedtuple('FileState', 'size, mtime, hash')
+IndexDiff = namedtuple('IndexDiff', 'added, changed, deleted, unchanged')
+
+
+def file_hash(file_pth: str, block_size: int = 1024 ** 2) -> str:
+    """Get blake2b hash of file content."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_pth, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(manifest_pth: str = MANIFEST_PTH) -> dict:
+    """Load manifest, empty one if there is no file."""
+    if not os.path.exists(manifest_pth):
+        return {'model': None, 'sketches': None, 'profiler': None,
+                'files': {}}
+    with open(manifest_pth) as f:
+        manifest = json.load(f)
+    manifest.setdefault('sketches', None)
+    manifest.setdefault('profiler', None)
+    manifest['files'] = {pth: FileState(*state)
+                         for pth, state in manifest['files'].items()}
+    return manifest
+
+
+def save_manifest(manifest: dict, manifest_pth: str = MANIFEST_PTH):
+    """Save manifest as json."""
+    manifest_dir = os.path.dirname(manifest_pth)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+    with open(manifest_pth, 'w') as f:
+        json.dump({'model': manifest['model'],
+                   'sketches': manifest.get('sketches'),
+                   'profiler': manifest.get('profiler'),
+                   'files': {pth: list(state) for pth, state
+                             in manifest['files'].items()}},
+                  f, indent=1)
+
+
+def model_state(model_pth: str) -> list:
+    """Model identity: embeddings are invalid if it changes."""
+    stat = os.stat(model_pth)
+    return [os.path.abspath(model_pth), stat.st_size, stat.st_mtime]
+
+
+def scan_files(data_dir: str, old_files: dict) -> tuple[dict, 'IndexDiff']:
+    """
+    Get new FileState of csv files in data_dir and diff with old_files.
+
+    Content hash is computed only when size or mtime differs from
+    old state (file touched without changes is not re-embedded).
+    """
+    files = {}
+    added, changed, unchanged = [], [], []
+    for file_pth in iter_csv_files(data_dir):
+        stat = os.stat(file_pth)
+        old = old_files.get(file_pth)
+        if old is not None and old.size == stat.st_size and \
+                old.mtime == stat.st_mtime:
+            files[file_pth] = old
+            unchanged.append(file_pth)
+            continue
+        state = FileState(stat.st_size, stat.st_mtime, file_hash(file_pth))
+        files[file_pth] = state
+        if old is None:
+            added.append(file_pth)
+        elif old.hash != state.hash:
+            changed.append(file_pth)
+        else:
+            unchanged.append(file_pth)
+    deleted = [pth for pth in old_files if pth not in files]
+    return files, IndexDiff(added, changed, deleted, unchanged)
+
+
+def build_manifest(model_pth: str, data_dir: str,
+                   sketcher: ValueSketcher | None = None,
+                   profiler: ColumnProfiler | None = None) -> dict:
+    """
+    Manifest of a full build of data_dir.
+
+    Taken before embedding: a file changed during the build is re-embedded
+    by the next update.
+    """
+    files, _ = scan_files(data_dir, {})
+    return {'model': model_state(model_pth),
+            'sketches': sketcher.params() if sketcher else None,
+            'profiler': profiler.params() if profiler else None,
+            'files': files}
+
+
+def update_index(model_pth: str, data_dir: str,
+                 index_dir: str = INDEX_DIR,
+                 manifest_pth: str = MANIFEST_PTH,
+                 workers: int | None = None,
+                 verbose: bool = True,
+                 sketcher: ValueSketcher | None = None,
+                 profiler: ColumnProfiler | None = None,
+                 dtype='float32',
+                 quantizer: ProductQuantizer | None = None
+                 ) -> list['ColEmbedding']:
+    """
+    Update index of data_dir (in index_dir) and its manifest.
+
+    Only new and changed files are embedded, columns of deleted files are
+    dropped. Old columns are kept only for files unchanged since manifest
+    (index can have columns of files missing in manifest if it was saved
+    without manifest). Full rebuild if there is no index or the model,
+    sketcher or profiler params were changed.
+    Columns are ordered as files in data_dir (as after full build, saved
+    index groups them by type if they are profiled).
+    Storage (dtype of vectors, PQ codes of quantizer) does not need
+    embedding: it is rewritten on every update.
+    """
+    manifest = load_manifest(manifest_pth)
+    model = model_state(model_pth)
+    sketches = sketcher.params() if sketcher else None
+    profiles = profiler.params() if profiler else None
+    old_embeddings = []
+    if manifest['model'] == model and manifest['sketches'] == sketches and \
+            manifest['profiler'] == profiles and \
+            os.path.exists(os.path.join(index_dir, META_FILE)):
+        old_embeddings = ColumnsIndex.load(index_dir)
+    else:
+        manifest['files'] = {}
+    files, diff = scan_files(data_dir, manifest['files'])
+    if verbose:
+        print(f'Added: {len(diff.added)}, changed: {len(diff.changed)}, '
+              f'deleted: {len(diff.deleted)}, '
+              f'unchanged: {len(diff.unchanged)}')
+
+    files_embeddings = {pth: [] for pth in files}
+    unchanged = set(diff.unchanged)
+    for emb in old_embeddings:
+        if emb.file_pth in unchanged:
+            files_embeddings[emb.file_pth].append(emb)
+    to_embed = diff.added + diff.changed
+    for emb in embed_files(model_pth, to_embed, workers, verbose=verbose,
+                           sketcher=sketcher, profiler=profiler):
+        files_embeddings[emb.file_pth].append(emb)
+
+    res = [emb for pth in files for emb in files_embeddings[pth]]
+    save_index(res, index_dir, sketcher, dtype, quantizer)
+    save_manifest({'model': model, 'sketches': sketches,
+                   'profiler': profiles, 'files': files}, manifest_pth)
+    return res
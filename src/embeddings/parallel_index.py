@@ -0,0 +1,130 @@
+"""Multi-process embedding of all csv files of DWH."""
+from multiprocessing import Pool
+import os
+from gensim.models import FastText
+from config import TOKEN_CACHE_MAX_BYTES
+from src.embeddings.get_embeddins import (CHUNK_SIZE, ColEmbedding,
+                                          embed_csv_file, iter_csv_files)
+from src.embeddings.token_cache import TokenVectorCache
+from src.embeddings.columns_index import save_columns_index
+from src.embeddings.sampling import RowSampler
+from src.embeddings.sketches import ValueSketcher
+from src.embeddings.profiling import ColumnProfiler
+from src.embeddings.quantization import ProductQuantizer
+
+# model and cache of worker process, set by _init_worker
+_worker_wv = None
+_worker_cache = None
+_worker_chunk_size = CHUNK_SIZE
+_worker_sampler = None
+_worker_sketcher = None
+_worker_profiler = None
+
+
+def _init_worker(model_pth: str, chunk_size: int, cache_max_bytes: int,
+                 sampler: RowSampler | None = None,
+                 sketcher: ValueSketcher | None = None,
+                 profiler: ColumnProfiler | None = None):
+    """Load model (memory-mapped, pages are shared) once per worker."""
+    global _worker_wv, _worker_cache, _worker_chunk_size, _worker_sampler
+    global _worker_sketcher, _worker_profiler
+    _worker_wv = FastText.load(model_pth, mmap='r').wv
+    _worker_cache = TokenVectorCache(_worker_wv, max_bytes=cache_max_bytes)
+    _worker_chunk_size = chunk_size
+    _worker_sampler = sampler
+    _worker_sketcher = sketcher
+    _worker_profiler = profiler
+
+
+def _embed_file(file_pth: str) -> list['ColEmbedding']:
+    """Embed one file in worker."""
+    return embed_csv_file(_worker_wv, file_pth, _worker_chunk_size,
+                          _worker_cache, _worker_sampler, _worker_sketcher,
+                          _worker_profiler)
+
+
+def build_index(model_pth: str, data_dir: str, workers: int | None = None,
+                chunk_size: int = CHUNK_SIZE,
+                cache_max_bytes: int = TOKEN_CACHE_MAX_BYTES,
+                verbose: bool = True,
+                sampler: RowSampler | None = None,
+                sketcher: ValueSketcher | None = None,
+                profiler: ColumnProfiler | None = None
+                ) -> list['ColEmbedding']:
+    """
+    Get embeddings of all columns in data_dir using process pool.
+
+    Result order is the same as in get_columns_embeddings (os.walk order
+    of files), whatever the number of workers.
+    Args:
+        model_pth (str): path to saved FastText model.
+        data_dir (str): directory with csv files.
+        workers (int, optional): number of processes. Defaults to None
+            (os.cpu_count()). 1 means embedding in current process.
+        chunk_size (int, optional): rows per chunk. Defaults to CHUNK_SIZE.
+        cache_max_bytes (int, optional): token cache memory per worker.
+            Defaults to TOKEN_CACHE_MAX_BYTES.
+        verbose (bool, optional): print progress. Defaults to True.
+        sampler (RowSampler, optional): rows sampling strategy. Defaults
+            to None (all rows).
+        sketcher (ValueSketcher, optional): compute value sketches of
+            columns too. Defaults to None.
+        profiler (ColumnProfiler, optional): infer types of columns too.
+            Defaults to None.
+
+    Returns:
+        list[ColEmbedding]: embeddings of columns.
+    """
+    return embed_files(model_pth, list(iter_csv_files(data_dir)), workers,
+                       chunk_size, cache_max_bytes, verbose, sampler,
+                       sketcher, profiler)
+
+
+def embed_files(model_pth: str, files: list[str],
+                workers: int | None = None,
+                chunk_size: int = CHUNK_SIZE,
+                cache_max_bytes: int = TOKEN_CACHE_MAX_BYTES,
+                verbose: bool = True,
+                sampler: RowSampler | None = None,
+                sketcher: ValueSketcher | None = None,
+                profiler: ColumnProfiler | None = None
+                ) -> list['ColEmbedding']:
+    """Get embeddings of columns of files (in files order), see build_index."""
+    if not files:
+        return []
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(len(files), 1))
+    init_args = (model_pth, chunk_size, cache_max_bytes, sampler, sketcher,
+                 profiler)
+    if workers == 1:
+        _init_worker(*init_args)
+        return _collect(files, map(_embed_file, files), verbose)
+    with Pool(workers, initializer=_init_worker,
+              initargs=init_args) as pool:
+        return _collect(files, pool.imap(_embed_file, files), verbose)
+
+
+def _collect(files, files_embeddings, verbose) -> list['ColEmbedding']:
+    """Merge embeddings of files in files order, print progress."""
+    res = []
+    pairs = zip(files, files_embeddings)
+    for i, (file_pth, embeddings) in enumerate(pairs):
+        res.extend(embeddings)
+        if verbose:
+            print(f'[{i + 1}/{len(files)}] {file_pth}: '
+                  f'{len(embeddings)} columns')
+    return res
+
+
+def save_index(embeddings: list['ColEmbedding'], index_dir: str,
+               sketcher: ValueSketcher | None = None, dtype='float32',
+               quantizer: ProductQuantizer | None = None):
+    """
+    Save embeddings list (and sketches of sketcher) to index_dir.
+
+    Vectors are stored as dtype, PQ codes are saved if quantizer is given.
+    """
+    save_columns_index(embeddings, index_dir,
+                       sketcher.params() if sketcher else None,
+                       dtype, quantizer)
+    print(f'Index of {len(embeddings)} columns saved to {index_dir}')
@@ -0,0 +1,128 @@
+"""
+Column type inference and cheap stats, computed while embedding.
+
+Type is one of COLUMN_TYPES: share of not empty values parsed as
+integer / float / date must be at least type_share, columns with few
+distinct values are categorical, the rest is text.
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+COLUMN_TYPES = ('integer', 'float', 'date', 'categorical', 'text')
+ColumnProfile = namedtuple('ColumnProfile',
+                           'col_type, values, empty_share, distinct, '
+                           'mean_length, num_min, num_max, num_mean')
+# numeric fields of ColumnProfile (stored as float matrix in index)
+PROFILE_STATS = ColumnProfile._fields[1:]
+
+INTEGER_RE = r'[+-]?\d+'
+DATE_RE = (r'\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?'
+           r'|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}'
+           r'|\d{4}/\d{1,2}/\d{1,2}')
+
+
+class ColumnProfiler:
+    """Profiling params, creates TableProfile for tables."""
+
+    def __init__(self, type_share: float = 0.9, categorical_max: int = 50,
+                 max_distinct: int = 1000):
+        """
+        Init profiler.
+
+        Args:
+            type_share (float, optional): share of values of the type.
+                Defaults to 0.9.
+            categorical_max (int, optional): column with not more
+                distinct values is categorical. Defaults to 50.
+            max_distinct (int, optional): distinct values are counted
+                exactly up to this number (then distinct is nan).
+                Defaults to 1000.
+        """
+        self.type_share = type_share
+        self.categorical_max = categorical_max
+        self.max_distinct = max_distinct
+
+    def params(self) -> dict:
+        """Params to save with index manifest."""
+        return {'type_share': self.type_share,
+                'categorical_max': self.categorical_max,
+                'max_distinct': self.max_distinct}
+
+    def table(self, n_cols: int) -> 'TableProfile':
+        """Empty profile of table with n_cols columns."""
+        return TableProfile(self, n_cols)
+
+    def col_type(self, values: int, integers: int, numbers: int,
+                 dates: int, distinct: float) -> str:
+        """Infer type by counts of parsed values."""
+        if values == 0:
+            return 'text'
+        need = self.type_share * values
+        if integers >= need:
+            return 'integer'
+        if numbers >= need:
+            return 'float'
+        if dates >= need:
+            return 'date'
+        if not np.isnan(distinct) and distinct <= self.categorical_max:
+            return 'categorical'
+        return 'text'
+
+
+class TableProfile:
+    """Running counts of table columns values."""
+
+    def __init__(self, profiler: 'ColumnProfiler', n_cols: int):
+        self.profiler = profiler
+        self.rows = 0
+        # per column: not empty values, integers, numbers, dates, length
+        self.counts = np.zeros((n_cols, 5), dtype=np.int64)
+        self.num_sum = np.zeros(n_cols)
+        self.num_min = np.full(n_cols, np.inf)
+        self.num_max = np.full(n_cols, -np.inf)
+        # exact distinct values while there are not many of them
+        self.distinct = [set() for _ in range(n_cols)]
+
+    def update(self, rows: list[list[str]]):
+        """Add chunk of rows (all with n_cols cells)."""
+        self.rows += len(rows)
+        for i in range(len(self.counts)):
+            values = pd.Series([row[i] for row in rows],
+                               dtype=object).str.strip()
+            values = values[values != '']
+            if values.empty:
+                continue
+            numbers = pd.to_numeric(values, errors='coerce').to_numpy(
+                dtype=np.float64, na_value=np.nan)
+            numbers = numbers[np.isfinite(numbers)]
+            self.counts[i] += (
+                len(values),
+                values.str.fullmatch(INTEGER_RE).sum(),
+                len(numbers),
+                values.str.fullmatch(DATE_RE).sum(),
+                values.str.len().sum())
+            if len(numbers):
+                self.num_sum[i] += numbers.sum()
+                self.num_min[i] = min(self.num_min[i], numbers.min())
+                self.num_max[i] = max(self.num_max[i], numbers.max())
+            if self.distinct[i] is not None:
+                self.distinct[i].update(values.unique())
+                if len(self.distinct[i]) > self.profiler.max_distinct:
+                    self.distinct[i] = None
+
+    def column(self, ind: int) -> 'ColumnProfile':
+        """Profile of column ind."""
+        values, integers, numbers, dates, length = self.counts[ind]
+        distinct = np.nan if self.distinct[ind] is None \
+            else float(len(self.distinct[ind]))
+        return ColumnProfile(
+            col_type=self.profiler.col_type(values, integers, numbers,
+                                            dates, distinct),
+            values=float(values),
+            empty_share=1 - values / self.rows if self.rows else 0.0,
+            distinct=distinct,
+            mean_length=length / values if values else 0.0,
+            num_min=self.num_min[ind] if numbers else np.nan,
+            num_max=self.num_max[ind] if numbers else np.nan,
+            num_mean=self.num_sum[ind] / numbers if numbers else np.nan)
@@ -0,0 +1,129 @@
+"""
+Product quantization of column embeddings.
+
+Vector is split into n_subvectors parts, every part is replaced by id of
+the nearest of n_centroids centroids of its subspace: with 256 centroids
+a vector is stored as n_subvectors bytes. Distance from a query to coded
+vector is the sum of looked up query-to-centroid distances (asymmetric
+distance computation, the query is not quantized).
+"""
+import numpy as np
+from scipy import sparse
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Get id of the nearest centroid of every vector."""
+    dist = np.einsum('ij,ij->i', centroids, centroids)[None, :] - \
+        2 * (vectors @ centroids.T)
+    return np.argmin(dist, axis=1)
+
+
+def kmeans(train: np.ndarray, n_clusters: int, n_iter: int,
+           rng: np.random.Generator) -> np.ndarray:
+    """Lloyd k-means of float32 train vectors, returns centroids."""
+    centroids = train[rng.choice(len(train), n_clusters,
+                                 replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _nearest(train, centroids)
+        one_hot = sparse.csr_matrix(
+            (np.ones(len(train), dtype=np.float32), labels,
+             np.arange(len(train) + 1)),
+            shape=(len(train), n_clusters))
+        sums = one_hot.T @ train
+        counts = np.bincount(labels, minlength=n_clusters)
+        not_empty = counts > 0
+        centroids[not_empty] = sums[not_empty] / counts[not_empty, None]
+    return centroids
+
+
+class ProductQuantizer:
+    """Codebooks of subspaces, encodes vectors to uint8 codes."""
+
+    def __init__(self, n_subvectors: int = 8, n_centroids: int = 256,
+                 n_iter: int = 10, train_size: int = 65536,
+                 seed: int = 42):
+        """
+        Init untrained quantizer.
+
+        Args:
+            n_subvectors (int, optional): bytes per coded vector, must
+                divide dimension. Defaults to 8.
+            n_centroids (int, optional): centroids per subspace (at most
+                256). Defaults to 256.
+            n_iter (int, optional): k-means iterations. Defaults to 10.
+            train_size (int, optional): training vectors. Defaults to
+                65536.
+            seed (int, optional): random seed. Defaults to 42.
+        """
+        if not 0 < n_centroids <= 256:
+            raise ValueError(f'n_centroids must be in 1..256: {n_centroids}')
+        self.n_subvectors = n_subvectors
+        self.n_centroids = n_centroids
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        # n_subvectors x n_centroids x subvector dim
+        self.codebooks = None
+
+    @classmethod
+    def from_codebooks(cls, codebooks: np.ndarray) -> 'ProductQuantizer':
+        """Trained quantizer with saved codebooks."""
+        quantizer = cls(codebooks.shape[0], codebooks.shape[1])
+        quantizer.codebooks = np.asarray(codebooks, dtype=np.float32)
+        return quantizer
+
+    def params(self) -> dict:
+        """Params to save with index meta."""
+        return {'n_subvectors': self.n_subvectors,
+                'n_centroids': self.n_centroids}
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """View vectors as n x n_subvectors x subvector dim."""
+        return vectors.reshape(len(vectors), self.n_subvectors, -1)
+
+    def fit(self, vectors: np.ndarray) -> 'ProductQuantizer':
+        """Train codebooks on a sample of vectors (can be memory-mapped)."""
+        n, dim = vectors.shape
+        if dim % self.n_subvectors:
+            raise ValueError(f'Dimension {dim} is not divisible by '
+                             f'n_subvectors {self.n_subvectors}')
+        # small index has a centroid per vector
+        self.n_centroids = min(self.n_centroids, n)
+        rng = np.random.default_rng(self.seed)
+        train_ind = np.sort(rng.choice(n, min(n, self.train_size),
+                                       replace=False))
+        train = self._split(np.asarray(vectors[train_ind], dtype=np.float32))
+        self.codebooks = np.stack([
+            kmeans(np.ascontiguousarray(train[:, i]), self.n_centroids,
+                   self.n_iter, rng)
+            for i in range(self.n_subvectors)])
+        return self
+
+    def encode(self, vectors: np.ndarray, block_size: int = 65536
+               ) -> np.ndarray:
+        """Get n x n_subvectors uint8 codes of vectors."""
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for start in range(0, len(vectors), block_size):
+            block = self._split(np.asarray(
+                vectors[start:start + block_size], dtype=np.float32))
+            for i in range(self.n_subvectors):
+                codes[start:start + len(block), i] = _nearest(
+                    block[:, i], self.codebooks[i])
+        return codes
+
+    def distance_tables(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Squared distances of query parts to centroids,
+        queries x n_subvectors x n_centroids.
+        """
+        parts = self._split(np.asarray(queries, dtype=np.float32))
+        diff = parts[:, :, None, :] - self.codebooks[None]
+        return np.einsum('qmcd,qmcd->qmc', diff, diff)
+
+    def adc_distances(self, tables: np.ndarray, codes: np.ndarray
+                      ) -> np.ndarray:
+        """Approximate squared distances queries x codes by tables."""
+        dist = np.zeros((len(tables), len(codes)), dtype=np.float32)
+        for i in range(self.n_subvectors):
+            dist += tables[:, i][:, codes[:, i]]
+        return dist
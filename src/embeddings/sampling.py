@@ -0,0 +1,148 @@
+"""Row sampling strategies for column embeddings of big tables."""
+from numbers import Integral, Real
+from typing import Iterable
+import numpy as np
+
+
+def _check_param(name: str, value, minimum, integer: bool = True):
+    """Raise TypeError if value is not a number, ValueError if < minimum."""
+    kind = Integral if integer else Real
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise TypeError(f'{name} must be '
+                        f'{"an integer" if integer else "a number"}, '
+                        f'got {value!r}')
+    if not value >= minimum:
+        raise ValueError(f'{name} must be >= {minimum}, got {value}')
+
+
+class RowSampler:
+    """
+    Base sampler: decides which rows of a table go to the accumulator.
+
+    feed gets iterator of row chunks of one file and ColumnsAccumulator.
+    Samplers keep no state between files.
+    """
+
+    def feed(self, chunks: Iterable[list[list[str]]], accumulator):
+        """Embed all rows (no sampling)."""
+        for chunk in chunks:
+            accumulator.update(chunk)
+
+
+class HeadSampler(RowSampler):
+    """First n_rows rows of table, the rest of file is not read."""
+
+    def __init__(self, n_rows: int = 10000):
+        """Init sampler of n_rows rows."""
+        _check_param('n_rows', n_rows, 0)
+        self.n_rows = n_rows
+
+    def feed(self, chunks, accumulator):
+        left = self.n_rows
+        for chunk in chunks:
+            accumulator.update(chunk[:left])
+            left -= len(chunk)
+            if left <= 0:
+                break
+
+
+class ReservoirSampler(RowSampler):
+    """
+    Uniform sample of n_rows rows in one streaming pass (algorithm R).
+
+    File is still parsed to the end, but only sampled rows are embedded.
+    """
+
+    def __init__(self, n_rows: int = 10000, seed: int | None = 42,
+                 update_rows: int = 1024):
+        """Init sampler of n_rows rows, embedded by update_rows."""
+        _check_param('n_rows', n_rows, 0)
+        if seed is not None:
+            _check_param('seed', seed, 0)
+        _check_param('update_rows', update_rows, 1)
+        self.n_rows = n_rows
+        self.seed = seed
+        self.update_rows = update_rows
+
+    def feed(self, chunks, accumulator):
+        rng = np.random.default_rng(self.seed)
+        reservoir = []
+        seen = 0
+        for chunk in chunks:
+            free = max(self.n_rows - len(reservoir), 0)
+            reservoir.extend(chunk[:free])
+            rest = chunk[free:]
+            seen += len(chunk) - len(rest)
+            if not rest:
+                continue
+            # row number t replaces random reservoir slot with prob n/(t+1)
+            slots = rng.integers(0, np.arange(seen, seen + len(rest)) + 1)
+            for row_ind in np.flatnonzero(slots < self.n_rows):
+                reservoir[slots[row_ind]] = rest[row_ind]
+            seen += len(rest)
+        for start in range(0, len(reservoir), self.update_rows):
+            accumulator.update(reservoir[start:start + self.update_rows])
+
+
+class ConvergenceSampler(RowSampler):
+    """
+    Read rows until running means of all columns converge.
+
+    Every check_rows rows means are compared with the previous check;
+    reading stops when cosine distance of every column is below tol.
+    """
+
+    def __init__(self, tol: float = 1e-4, check_rows: int = 2048,
+                 min_rows: int = 2048):
+        """Init sampler: stop after min_rows if drift <= tol."""
+        _check_param('tol', tol, 0, integer=False)
+        _check_param('check_rows', check_rows, 1)
+        _check_param('min_rows', min_rows, 0)
+        self.tol = tol
+        self.check_rows = check_rows
+        self.min_rows = min_rows
+
+    def feed(self, chunks, accumulator):
+        previous = None
+        next_check = max(self.check_rows, self.min_rows)
+        rows = 0
+        for chunk in chunks:
+            accumulator.update(chunk)
+            rows += len(chunk)
+            if rows < next_check:
+                continue
+            next_check = rows + self.check_rows
+            means = accumulator.means()
+            if previous is not None and \
+                    cosine_drift(previous, means).max() <= self.tol:
+                break
+            previous = means
+
+
+def cosine_drift(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """1 - cosine similarity of rows (0 for two zero rows, 1 for one)."""
+    expected = np.atleast_2d(expected)
+    actual = np.atleast_2d(actual)
+    norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    dots = np.einsum('ij,ij->i', expected, actual)
+    similarity = np.divide(dots, norms, out=np.zeros_like(dots),
+                           where=norms > 0)
+    both_zero = ~expected.any(axis=1) & ~actual.any(axis=1)
+    similarity[both_zero] = 1
+    return 1 - similarity
+
+
+SAMPLERS = {
+    'full': RowSampler,
+    'head': HeadSampler,
+    'reservoir': ReservoirSampler,
+    'converge': ConvergenceSampler,
+}
+
+
+def make_sampler(strategy: str = 'full', **params) -> RowSampler:
+    """Build sampler by name ('full', 'head', 'reservoir', 'converge')."""
+    if strategy not in SAMPLERS:
+        raise ValueError(f'Unknown sampling strategy {strategy}. '
+                         f'Available: {", ".join(SAMPLERS)}')
+    return SAMPLERS[strategy](**params)
@@ -0,0 +1,123 @@
+"""
+Value sketches of columns: MinHash (Jaccard) and HyperLogLog (distinct).
+
+Sketches are computed in the same csv pass as embeddings and show which
+columns share actual values (join candidates), not only look alike.
+"""
+import numpy as np
+import pandas as pd
+from config import SKETCH_HLL_P, SKETCH_NUM_PERM
+
+# minhash of column without values
+EMPTY_HASH = np.iinfo(np.uint64).max
+
+
+def hash_values(values: list[str]) -> np.ndarray:
+    """Stable (between processes) unique 64-bit hashes of values."""
+    hashes = pd.util.hash_array(np.array(values, dtype=object))
+    return np.unique(hashes)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Bit length of uint64 values (exact: halves go through float64)."""
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, np.frexp(high)[1] + 32, np.frexp(low)[1])
+
+
+def hll_count(registers: np.ndarray) -> np.ndarray:
+    """
+    Estimate distinct count by HLL registers (one row per column).
+
+    Linear counting is used for small cardinalities.
+    """
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m ** 2 / np.sum(np.exp2(-registers.astype(np.float64)),
+                                  axis=1)
+    zeros = np.sum(registers == 0, axis=1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, raw)
+
+
+def estimate_overlap(jaccard, distinct_a, distinct_b):
+    """Estimate |A & B| by Jaccard and distinct counts of A and B."""
+    jaccard = np.asarray(jaccard, dtype=np.float64)
+    return jaccard / (1 + jaccard) * (np.asarray(distinct_a) +
+                                      np.asarray(distinct_b))
+
+
+class ValueSketcher:
+    """
+    MinHash and HLL parameters, creates TableSketches for tables.
+
+    Index and queries must use sketcher with the same params.
+    """
+
+    def __init__(self, num_perm: int = SKETCH_NUM_PERM,
+                 hll_p: int = SKETCH_HLL_P, seed: int = 1):
+        """
+        Init num_perm MinHash permutations and 2**hll_p HLL registers.
+
+        Permutation i is x -> a_i * x + b_i mod 2**64 (a_i is odd).
+        """
+        self.num_perm = num_perm
+        self.hll_p = hll_p
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, EMPTY_HASH, num_perm, dtype=np.uint64,
+                               endpoint=True) | np.uint64(1)
+        self._b = rng.integers(0, EMPTY_HASH, num_perm, dtype=np.uint64,
+                               endpoint=True)
+
+    def params(self) -> dict:
+        """Params to save with index."""
+        return {'num_perm': self.num_perm, 'hll_p': self.hll_p,
+                'seed': self.seed}
+
+    def table(self, n_cols: int) -> 'TableSketches':
+        """Empty sketches of table with n_cols columns."""
+        return TableSketches(self, n_cols)
+
+    def minhash(self, hashes: np.ndarray) -> np.ndarray:
+        """MinHash signature of unique value hashes."""
+        if not len(hashes):
+            return np.full(self.num_perm, EMPTY_HASH, dtype=np.uint64)
+        return (np.multiply.outer(hashes, self._a) + self._b).min(axis=0)
+
+    def hll_ranks(self, hashes: np.ndarray
+                  ) -> tuple[np.ndarray, np.ndarray]:
+        """HLL register index and rank of every hash."""
+        rest_bits = 64 - self.hll_p
+        registers = (hashes >> np.uint64(rest_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << rest_bits) - 1)
+        ranks = rest_bits - _bit_length(rest) + 1
+        return registers, ranks.astype(np.uint8)
+
+
+class TableSketches:
+    """Running MinHash signatures and HLL registers of table columns."""
+
+    def __init__(self, sketcher: 'ValueSketcher', n_cols: int):
+        self.sketcher = sketcher
+        self.minhashes = np.full((n_cols, sketcher.num_perm), EMPTY_HASH,
+                                 dtype=np.uint64)
+        self.hlls = np.zeros((n_cols, 2 ** sketcher.hll_p), dtype=np.uint8)
+
+    def update(self, rows: list[list[str]]):
+        """Add chunk of rows (all with n_cols cells). Empty cells skipped."""
+        for i in range(len(self.minhashes)):
+            values = [row[i] for row in rows if row[i]]
+            if not values:
+                continue
+            hashes = hash_values(values)
+            np.minimum(self.minhashes[i], self.sketcher.minhash(hashes),
+                       out=self.minhashes[i])
+            registers, ranks = self.sketcher.hll_ranks(hashes)
+            np.maximum.at(self.hlls[i], registers, ranks)
+
+    def column(self, ind: int) -> tuple[np.ndarray, np.ndarray]:
+        """MinHash and HLL registers of column ind."""
+        return self.minhashes[ind], self.hlls[ind]
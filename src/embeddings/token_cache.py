@@ -0,0 +1,95 @@
+"""Bounded LRU cache of FastText token vectors."""
+from collections import OrderedDict
+import threading
+import numpy as np
+from config import TOKEN_CACHE_MAX_BYTES
+from src.embeddings.batch_embeddings import lookup_vectors
+from src.monitoring.metrics import count
+
+
+class TokenVectorCache:
+    """
+    LRU token -> vector cache over FastTextKeyedVectors.
+
+    Vectors are kept in one preallocated matrix, so max_bytes bounds the
+    cache memory and hits are gathered by a single fancy index. Safe to
+    share between threads of the server.
+    """
+
+    def __init__(self, wv, max_bytes: int = TOKEN_CACHE_MAX_BYTES):
+        """Init cache for wv with vectors memory no more than max_bytes."""
+        self.wv = wv
+        row_bytes = wv.vector_size * wv.vectors.dtype.itemsize
+        self.capacity = max(int(max_bytes) // row_bytes, 0)
+        self._vectors = np.empty((self.capacity, wv.vector_size),
+                                 dtype=wv.vectors.dtype)
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._free_slots = list(range(self.capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get_vectors(self, tokens: list[str]) -> np.ndarray:
+        """Same as lookup_vectors(self.wv, tokens), but with cache."""
+        res = np.empty((len(tokens), self.wv.vector_size),
+                       dtype=self.wv.vectors.dtype)
+        hit_pos, hit_slots, miss_pos = [], [], []
+        with self._lock:
+            for pos, token in enumerate(tokens):
+                slot = self._slots.get(token)
+                if slot is None:
+                    miss_pos.append(pos)
+                    continue
+                self._slots.move_to_end(token)
+                hit_pos.append(pos)
+                hit_slots.append(slot)
+            if hit_pos:
+                res[hit_pos] = self._vectors[hit_slots]
+            self.hits += len(hit_pos)
+            self.misses += len(miss_pos)
+        count('cache_hits', len(hit_pos))
+        count('cache_misses', len(miss_pos))
+        if not miss_pos:
+            return res
+        miss_tokens = [tokens[pos] for pos in miss_pos]
+        res[miss_pos] = lookup_vectors(self.wv, miss_tokens)
+        if self.capacity:
+            self._insert(miss_tokens[-self.capacity:],
+                         res[miss_pos[-self.capacity:]])
+        return res
+
+    def _insert(self, tokens: list[str], vectors: np.ndarray):
+        """Put vectors to cache evicting least recently used tokens."""
+        with self._lock:
+            for token, vector in zip(tokens, vectors):
+                if token in self._slots:
+                    continue
+                if self._free_slots:
+                    slot = self._free_slots.pop()
+                else:
+                    _, slot = self._slots.popitem(last=False)
+                self._vectors[slot] = vector
+                self._slots[token] = slot
+
+    def clear(self):
+        """Drop all cached vectors and counters."""
+        with self._lock:
+            self._slots.clear()
+            self._free_slots = list(range(self.capacity - 1, -1, -1))
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Get hits, misses, hit rate and size of cache."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'size': len(self._slots),
+                'capacity': self.capacity,
+            }
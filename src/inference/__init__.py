@@ -0,0 +1,4 @@
+"""Inference http-server (model and index are loaded lazily)."""
+from src.inference.model_api import raise_server
+
+__all__ = ['raise_server']
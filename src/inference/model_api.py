@@ -1,96 +1,579 @@
 """Rise http-server with RL-agent."""
-from flask import Flask, jsonify, request
+from flask import (Flask, Response, g, jsonify, request,
+                   stream_with_context)
+from flask.json.provider import DefaultJSONProvider
+from collections import namedtuple
+import csv
 import os
-from scipy import spatial
-import pickle
+import threading
 import numpy as np
-import csv
-from src.embeddings.get_embeddins import ColEmbedding
+from src.embeddings.get_embeddins import (embed_csv_file, embed_csv_lines,
+                                          sketch_csv_file)
+from src.embeddings.sketches import (ValueSketcher, estimate_overlap,
+                                     hll_count)
+from src.embeddings.token_cache import TokenVectorCache
 from gensim.models import FastText
+from config import (INDEX_DIR, LSH_THRESHOLD, MODEL_PTH, SEARCH_BACKEND,
+                    SEARCH_PARTITION_BY_TYPE, UPLOAD_MAX_BYTES,
+                    UPLOAD_MAX_ROWS, UPLOAD_TIMEOUT,
+                    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_UPLOAD_BYTES,
+                    RESULT_CACHE_TTL, SEARCH_PQ_RERANK)
+from src.embeddings.columns_index import META_FILE, ColumnsIndex
+from src.search.backends import make_backend
+from src.search.lsh import MinHashLSH
+from src.search.partitioned import PartitionedBackend
+from src.embeddings.profiling import ColumnProfiler
+from src.inference.upload import (UploadError, iter_lines, upload_blocks,
+                                  upload_encoding)
+from src.inference.result_cache import ResultCache, content_key, vector_key
+from src.embeddings.sampling import HeadSampler, make_sampler
+from src.monitoring.metrics import (CONTENT_TYPE, count, item_totals,
+                                    render_metrics, stage, track_request)
+
+LoadedModel = namedtuple('LoadedModel', 'model, token_cache')
+# lsh is None if index has no value sketches; results computed over index
+# are cached under its result cache generation
+LoadedIndex = namedtuple('LoadedIndex', 'info, tree, lsh, generation')
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    """Serialize numpy arrays and scalars (embeddings of ColEmbedding)."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return DefaultJSONProvider.default(o)
 
-model_pth = 'models/fasttext_one_element_240130-043242.model'
 
 app = Flask(__name__)
+app.json = NumpyJSONProvider(app)
 
 pwd = os.getcwd()
-with open(os.path.join(pwd, 'embeddings', 'embeddings.pkl'), 'rb') as f:
-    embeddings_info = pickle.load(f)
+model_pth = os.path.join(pwd, MODEL_PTH)
+index_dir = os.path.join(pwd, INDEX_DIR)
+# model and index are loaded on first use (or by warm_up thread)
+_model: LoadedModel | None = None
+_index: LoadedIndex | None = None
+# dir of loaded index and (inode, mtime) of its meta.json, see get_index
+_index_source: tuple[str, tuple] | None = None
+_load_lock = threading.Lock()
+# limit of requests processed at once by this process (None - no limit)
+_in_flight: threading.BoundedSemaphore | None = None
+# responses by content of request, see cached
+_result_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL)
+# endpoints answered even when the limit is reached
+UNLIMITED_ENDPOINTS = ('ready_get_request', 'metrics_get_request')
+
+
+def configure(new_model_pth: str | None = None,
+              new_index_dir: str | None = None):
+    """Set model and index paths (before they are loaded)."""
+    global model_pth, index_dir
+    if new_model_pth is not None:
+        model_pth = new_model_pth
+    if new_index_dir is not None:
+        index_dir = new_index_dir
+
+
+def set_max_in_flight(max_in_flight: int | None):
+    """Reject requests with 503 when max_in_flight are processed."""
+    global _in_flight
+    _in_flight = threading.BoundedSemaphore(max_in_flight) \
+        if max_in_flight else None
+
+
+def set_result_cache_size(max_entries: int):
+    """Set size of result cache (0 disables it), cached results dropped."""
+    _result_cache.max_entries = max_entries
+    _result_cache.clear()
+
+
+@app.before_request
+def acquire_request_slot():
+    """Fail fast with 503 instead of queueing when process is busy."""
+    if _in_flight is None or request.endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if not _in_flight.acquire(blocking=False):
+        count('rejected', 1)
+        return jsonify({'error': 'server is busy'}), 503
+    g.request_slot = _in_flight
+    return None
+
+
+@app.teardown_request
+def release_request_slot(exc=None):
+    """Release slot after response (streamed one too) is sent."""
+    slot = g.pop('request_slot', None)
+    if slot is not None:
+        slot.release()
+
+
+def load_model(pth: str | None = None) -> LoadedModel:
+    """(Re)load FastText model memory-mapped (shared between processes)."""
+    global _model
+    with stage('load_model'):
+        model = FastText.load(pth or model_pth, mmap='r')
+    _model = LoadedModel(model=model,
+                         token_cache=TokenVectorCache(model.wv))
+    return _model
+
+
+def _meta_version(pth: str) -> tuple | None:
+    """(inode, mtime) of meta.json of index in pth (replaced last on save)."""
+    try:
+        stat = os.stat(os.path.join(pth, META_FILE))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def load_index(pth: str | None = None) -> LoadedIndex:
+    """(Re)open memory-mapped index and rebuild search backend."""
+    global _index, _index_source
+    pth = pth or index_dir
+    # version is taken before loading: a save during load reloads again
+    version = _meta_version(pth)
+    with stage('load_index'):
+        info = ColumnsIndex.load(pth)
+        params = {}
+        if SEARCH_BACKEND == 'pq':
+            # saved codes, else quantizer is trained on load
+            params = {'rerank': SEARCH_PQ_RERANK,
+                      'codebooks': info.pq_codebooks, 'codes': info.pq_codes}
+        # index saved before rows were grouped by type has no partitions
+        if SEARCH_PARTITION_BY_TYPE and info.partitions is not None:
+            tree = PartitionedBackend(info.vectors, info.partitions,
+                                      SEARCH_BACKEND, **params)
+        else:
+            tree = make_backend(SEARCH_BACKEND, info.vectors, **params)
+        lsh = None
+        if info.minhashes is not None:
+            lsh = MinHashLSH(info.minhashes, LSH_THRESHOLD)
+    # cached responses refer to the old index, results computed over it
+    # now are not put under generation of the new one
+    generation = _result_cache.invalidate()
+    _index = LoadedIndex(info=info, tree=tree, lsh=lsh,
+                         generation=generation)
+    _index_source = (pth, version)
+    return _index
+
+
+def get_model() -> LoadedModel:
+    """Get model, load it on first call."""
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                load_model()
+    return _model
+
+
+def _index_changed() -> bool:
+    """Index files were saved again after they were loaded."""
+    pth, version = _index_source
+    current = _meta_version(pth)
+    return current is not None and current != version
+
+
+def get_index() -> LoadedIndex:
+    """
+    Get index, load it on first call and reload it when it was saved
+    again (by build_index / update_index): every server process picks up
+    the new index on its next request.
+    """
+    if _index is None or _index_changed():
+        with _load_lock:
+            if _index is None:
+                load_index()
+            elif _index_changed():
+                load_index(_index_source[0])
+    return _index
+
+
+def warm_up() -> threading.Thread:
+    """Load index and model in background thread."""
+    def target():
+        get_index()
+        get_model()
+        print('Model and index are loaded.')
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def neighbours_scores(distances, tree) -> dict:
+    """Distances of neighbours and similarities for cosine search."""
+    scores = {'distances': distances}
+    if tree.metric == 'cosine':
+        scores['similarities'] = 1 - distances
+    return scores
+
+
+def column_info(info: ColumnsIndex, ind: int) -> list:
+    """File path, column name and embedding of index row (no sketches)."""
+    emb = info[ind]
+    return [emb.file_pth, emb.col_name, emb.embedding]
+
+
+def search(tree, queries, k: int = 10, col_type: str | None = None):
+    """
+    tree.query timed as 'search' stage.
+
+    Partitioned index searches only partitions compatible with col_type.
+    Slots padded by backend (inf distance / index len) when fewer than k
+    neighbours are found are dropped, so for a matrix of queries lists of
+    arrays (one per query) are returned.
+    """
+    with stage('search'):
+        if isinstance(tree, PartitionedBackend):
+            distances, neighbors = tree.query(queries, k=k,
+                                              col_type=col_type)
+        else:
+            distances, neighbors = tree.query(queries, k=k)
+    found = np.isfinite(distances) & (neighbors < len(tree))
+    if np.ndim(neighbors) == 1:
+        distances, neighbors = distances[found], neighbors[found]
+    else:
+        distances = [row[keep] for row, keep in zip(distances, found)]
+        neighbors = [row[keep] for row, keep in zip(neighbors, found)]
+    count('neighbours', int(found.sum()))
+    return distances, neighbors
+
+
+def add_profile(response: dict, data: dict, stats) -> dict:
+    """Add stage breakdown if profiling is asked ("profile": true)."""
+    if data.get('profile') or request.args.get('profile'):
+        response['profile'] = stats.as_dict()
+    return response
+
+
+def cached(key, compute, generation: int) -> dict:
+    """
+    Response of compute() through result cache (key None - no cache).
+
+    generation is of the index compute() uses (taken with it by
+    get_index): result over reloaded index is not cached. Copy is
+    returned: caller can add profile to it.
+    """
+    if key is None:
+        return compute()
+    response = _result_cache.get(key)
+    if response is None:
+        count('result_cache_misses', 1)
+        response = compute()
+        _result_cache.put(key, response, generation)
+    else:
+        count('result_cache_hits', 1)
+    return dict(response)
+
+
+def query_profiler(index: LoadedIndex) -> ColumnProfiler | None:
+    """Profiler of queried columns (types are needed by partitioned index)."""
+    if isinstance(index.tree, PartitionedBackend):
+        return ColumnProfiler()
+    return None
+
 
-embeddings_vectors = np.array([emb.embedding for emb in embeddings_info])
-emb_tree = spatial.KDTree(embeddings_vectors)
+def query_matrix(embeddings, dim: int) -> np.ndarray:
+    """Float32 matrix of query vectors, ValueError if it is not n x dim."""
+    queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    if queries.ndim != 2 or queries.size == 0 or queries.shape[1] != dim:
+        raise ValueError('embeddings must be a non-empty list of vectors '
+                         f'of dimension {dim}, got shape {queries.shape}')
+    return queries
 
-model = FastText.load(model_pth)
+
+def columns_neighbours(cols_emb: list, index: LoadedIndex) -> list[dict]:
+    """Nearest index columns of every embedded column."""
+    res = []
+    for emb in cols_emb:
+        col_type = emb.profile.col_type if emb.profile else None
+        distances, neighbors_ind = search(index.tree, emb.embedding,
+                                          k=10, col_type=col_type)
+        neighbors_info = [column_info(index.info, i)
+                          for i in neighbors_ind]
+        res.append({'column': emb.col_name, 'col_type': col_type,
+                    'neighbours':
+                    {'names': neighbors_info,
+                     **neighbours_scores(distances, index.tree)}})
+    return res
 
 
 @app.route('/predict_on_vector', methods=['POST'])
 def predict_on_vector_post_request():
-    data = request.json
-    vec = data['embedding']
-    # get the indices of the nearest neighbors
-    neighbors = emb_tree.query(vec, k=10)[1]
-    res = [embeddings_info[i] for i in neighbors]
+    with track_request('predict_on_vector') as stats:
+        data = request.json
+        vec = data['embedding']
+        col_type = data.get('col_type')
+        index = get_index()
 
-    return jsonify({
-        'neighbor_columns': res
-        })
+        def compute():
+            # get the indices of the nearest neighbors (optionally of
+            # columns compatible with col_type)
+            distances, neighbors = search(index.tree, vec, k=10,
+                                          col_type=col_type)
+            return {
+                'neighbor_columns': [column_info(index.info, i)
+                                     for i in neighbors],
+                **neighbours_scores(distances, index.tree)
+                }
+
+        return jsonify(add_profile(cached(
+            ('vector', vector_key(vec), 10, col_type), compute,
+            index.generation),
+            data, stats))
 
 
 @app.route('/predict_on_file', methods=['POST'])
 def predict_on_file_post_request():
-    data = request.json
-    file_pth = data['file_pth']
-    cols_emb = []
-    with open(file_pth) as f:
-        reader = csv.reader(f)
-        header = next(reader, None)
-        embeddings = {col_name: 0 for col_name in header}
-        rows_count = 0
-        line = next(reader, None)
-        n_cols = len(header)
-        while line is not None:
-            if len(line) != n_cols:
-                print('Count of cells in some rows != count of cols in',
-                      file_pth)
-                line = next(reader, None)
-                continue
-            rows_count += 1
-            for i in range(n_cols):
-                vec = 0
-                for el in line[i].split():
-                    vec += model.wv.get_vector(el)
-                if len(line[i].split()) == 0 or np.all(vec == 0):
-                    continue
-                vec = vec / len(line[i].split())
-                embeddings[header[i]] += vec / len(line[i].split())
-            line = next(reader, None)
-        for col_name in header:
-            if rows_count == 0:
-                continue
-            embeddings[col_name] /= rows_count
-            col_emb_tuple = ColEmbedding(file_pth=file_pth,
-                                         col_name=col_name,
-                                         embedding=embeddings[col_name])
-            cols_emb.append(col_emb_tuple)
-    res = []
-    for emb in cols_emb:
-        neighbors_ind = emb_tree.query(emb.embedding, k=10)[1]
-        neighbors_info = [embeddings_info[i] for i in neighbors_ind]
-        res.append({'column': emb.col_name, 'neighbours':
-                    {'names': neighbors_info}})
+    with track_request('predict_on_file') as stats:
+        data = request.json
+        file_pth = data['file_pth']
+        # optional rows sampling, e.g. {"strategy": "head", "n_rows": 1000}
+        sampling = data.get('sampling', {})
+        try:
+            if not isinstance(sampling, dict):
+                raise TypeError('sampling must be an object, e.g. '
+                                '{"strategy": "head", "n_rows": 1000}')
+            sampler = make_sampler(**sampling)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Bad sampling: {e}'}), 400
+        model, token_cache = get_model()
+        index = get_index()
+
+        def compute():
+            cols_emb = embed_csv_file(model.wv, file_pth, cache=token_cache,
+                                      sampler=sampler,
+                                      profiler=query_profiler(index))
+            return {
+                'col_neighbours_map': columns_neighbours(cols_emb, index)
+                }
+
+        # file identity as in index manifest: content is not read (head
+        # sampling of a huge file reads only its head)
+        stat = os.stat(file_pth)
+        key = ('file', os.path.abspath(file_pth), stat.st_size,
+               stat.st_mtime_ns, repr(sorted(sampling.items())))
+        return jsonify(add_profile(cached(key, compute, index.generation),
+                                   data, stats))
+
+
+@app.route('/predict_on_upload', methods=['POST'])
+def predict_on_upload_post_request():
+    """
+    Streaming /predict_on_file for csv sent in request body.
+
+    Body is raw csv (chunked transfer encoding is supported) or
+    multipart/form-data with csv file. Rows are embedded while body is
+    read; reading stops after max_rows rows. Uploads not larger than
+    RESULT_CACHE_MAX_UPLOAD_BYTES are read at once and cached by content.
+    Query args: max_rows (default and maximum UPLOAD_MAX_ROWS), name
+    (source name of columns, default 'upload'), profile.
+    413 if body is larger than UPLOAD_MAX_BYTES, 408 if it is read longer
+    than UPLOAD_TIMEOUT seconds, 400 if it is not csv or max_rows is not
+    a positive integer.
+    """
+    with track_request('predict_on_upload') as stats:
+        arg = request.args.get('max_rows', str(UPLOAD_MAX_ROWS))
+        try:
+            max_rows = int(arg)
+        except ValueError:
+            max_rows = 0
+        if max_rows < 1:
+            return jsonify({'error': 'max_rows must be an integer >= 1, '
+                                     f'got {arg!r}'}), 400
+        max_rows = min(max_rows, UPLOAD_MAX_ROWS)
+        model, token_cache = get_model()
+        index = get_index()
+        name = request.args.get('name', 'upload')
+        try:
+            blocks, reader = upload_blocks(request, UPLOAD_MAX_BYTES,
+                                           UPLOAD_TIMEOUT)
+            key = None
+            if request.content_length is not None and \
+                    request.content_length <= RESULT_CACHE_MAX_UPLOAD_BYTES:
+                content = b''.join(blocks)
+                blocks = [content]
+                key = ('upload', content_key(content), max_rows, name)
+
+            def compute():
+                lines = iter_lines(blocks, upload_encoding(request))
+                cols_emb = embed_csv_lines(model.wv, lines, name,
+                                           cache=token_cache,
+                                           sampler=HeadSampler(max_rows),
+                                           profiler=query_profiler(index))
+                return {
+                    'col_neighbours_map': columns_neighbours(cols_emb,
+                                                             index)
+                    }
+
+            response = cached(key, compute, index.generation)
+            response['bytes_read'] = reader.bytes_read
+        except UploadError as e:
+            return jsonify({'error': str(e)}), e.status
+        except csv.Error as e:
+            return jsonify({'error': f'Bad csv: {e}'}), 400
+
+        return jsonify(add_profile(response, {}, stats))
+
+
+@app.route('/predict_on_vectors', methods=['POST'])
+def predict_on_vectors_post_request():
+    """
+    Batched search: one query to index for matrix of embeddings.
+
+    Request json: embeddings (list of vectors), k (default 10),
+    max_distance (optional, neighbours farther are dropped), col_type
+    (optional, type of all queried columns), profile.
+    Response is streamed: {"neighbours": [<result of every vector>]}
+    (profile covers search only, not streaming of results).
+    400 if k is not a positive integer, max_distance is not a number or
+    embeddings is not a non-empty matrix with index dimension.
+    """
+    with track_request('predict_on_vectors') as stats:
+        data = request.json
+        info, tree, _, _ = get_index()
+        try:
+            queries = query_matrix(data.get('embeddings'),
+                                   info.vectors.shape[1])
+            k = int(data.get('k', 10))
+            if k < 1:
+                raise ValueError(f'k must be >= 1, got {k}')
+            max_distance = data.get('max_distance')
+            if max_distance is not None:
+                max_distance = float(max_distance)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        distances, neighbors = search(tree, queries, k=k,
+                                      col_type=data.get('col_type'))
+        profile = add_profile({}, data, stats)
+
+    def generate():
+        yield '{"neighbours": ['
+        for i in range(len(neighbors)):
+            dist, ind = distances[i], neighbors[i]
+            if max_distance is not None:
+                keep = dist <= max_distance
+                dist, ind = dist[keep], ind[keep]
+            yield (',' if i else '') + app.json.dumps({
+                'neighbor_columns': [column_info(info, j) for j in ind],
+                **neighbours_scores(dist, tree)})
+        yield ']'
+        if profile:
+            yield ', "profile": ' + app.json.dumps(profile['profile'])
+        yield '}'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
+
+@app.route('/predict_overlap_on_file', methods=['POST'])
+def predict_overlap_on_file_post_request():
+    """
+    Columns sharing values with columns of file (join candidates).
+
+    Request json: file_pth, k (default 10), min_jaccard (default 0).
+    For every neighbour estimated Jaccard, distinct count, overlap
+    (shared distinct values) and containment (overlap / distinct count
+    of the file column) are returned. 400 if index has no sketches, k is
+    not a positive integer or min_jaccard is not a number.
+    """
+    with track_request('predict_overlap_on_file') as stats:
+        data = request.json
+        index = get_index()
+        if index.lsh is None:
+            return jsonify({'error': 'index has no value sketches'}), 400
+        try:
+            k = int(data.get('k', 10))
+            if k < 1:
+                raise ValueError(f'k must be >= 1, got {k}')
+            min_jaccard = float(data.get('min_jaccard', 0))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        sketches = sketch_csv_file(
+            data['file_pth'], ValueSketcher(**index.info.sketch_params))
+        res = []
+        for col_name, (minhash, hll) in sketches.items():
+            with stage('lsh_search'):
+                jaccard, neighbors = index.lsh.query(minhash, k,
+                                                     min_jaccard)
+            count('neighbours', len(neighbors))
+            distinct = hll_count(hll)[0]
+            neighbors_distinct = hll_count(index.info.hlls[neighbors]) \
+                if len(neighbors) else np.zeros(0)
+            overlap = estimate_overlap(jaccard, distinct,
+                                       neighbors_distinct)
+            res.append({'column': col_name, 'distinct': distinct,
+                        'neighbours': {
+                            'names': [column_info(index.info, i)
+                                      for i in neighbors],
+                            'jaccard': jaccard,
+                            'distinct': neighbors_distinct,
+                            'overlap': overlap,
+                            'containment': overlap / max(distinct, 1)}})
+
+        return jsonify(add_profile({
+            'col_neighbours_map': res
+            }, data, stats))
+
+
+@app.route('/reload_index', methods=['POST'])
+def reload_index_post_request():
+    """
+    Reload index of this process now (others reload on their next
+    request when index files change, see get_index).
+    """
+    with _load_lock:
+        index = load_index()
+    return jsonify({'columns': len(index.info)})
+
+
+@app.route('/ready', methods=['GET'])
+def ready_get_request():
+    """
+    Readiness: 200 when model and index are loaded, else 503.
+
+    Also reports result cache hits and misses of all server processes and
+    size of cache of this process.
+    """
+    status = {'model': _model is not None, 'index': _index is not None}
+    status['ready'] = status['model'] and status['index']
+    hits, misses = item_totals('result_cache_hits', 'result_cache_misses')
+    status['result_cache'] = {
+        'hits': hits, 'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'process_entries': len(_result_cache)}
+    return jsonify(status), 200 if status['ready'] else 503
+
 
-    return jsonify({
-        'col_neighbours_map': res
-        })
+@app.route('/metrics', methods=['GET'])
+def metrics_get_request():
+    """Stage timings and processed items in Prometheus text format."""
+    return Response(render_metrics(), mimetype=CONTENT_TYPE)
 
 
-def raise_server(host: str = '0.0.0.0', port: int = 6113):
+def raise_server(host: str = '0.0.0.0', port: int = 6113,
+                 model_pth: str | None = None,
+                 index_dir: str | None = None,
+                 lazy: bool = False):
     """
     Raise server on host:port.
 
     Args:
         host (str, optional): host. Defaults to '0.0.0.0'.
         port (int, optional): port. Defaults to 6113.
+        model_pth (str, optional): FastText model path. Defaults to None
+            (MODEL_PTH from config).
+        index_dir (str, optional): columnar index directory. Defaults
+            to None (INDEX_DIR from config).
+        lazy (bool, optional): load model and index on first request
+            instead of background warm-up. Defaults to False.
     """
+    configure(model_pth, index_dir)
+    if not lazy:
+        warm_up()
     app.run(host=host, port=port)
 
 
@@ -0,0 +1,109 @@
+"""
+Multi-process serving of model_api app with gunicorn.
+
+Every worker opens FastText model and index memory-mapped (mmap='r'), so
+the embedding matrices are stored once in page cache and shared by all
+workers. Every worker reloads the index on its next request after index
+files are saved again. Metrics of workers are shared through files in a
+temporary directory, /metrics of any worker returns their sum.
+
+Load shedding: a worker processes at most max_in_flight requests, its
+spare threads answer others with 503 at once. A worker accepts at most
+threads + queue_limit connections, the rest wait in the listen backlog.
+"""
+import os
+import shutil
+import tempfile
+from gunicorn.app.base import BaseApplication
+from config import (SERVER_BACKLOG, SERVER_MAX_IN_FLIGHT, SERVER_QUEUE_LIMIT,
+                    SERVER_THREADS, SERVER_TIMEOUT, SERVER_WORKERS,
+                    RESULT_CACHE_MAX_ENTRIES)
+from src.inference import model_api
+from src.monitoring import metrics
+
+
+def _post_fork(server, worker):
+    """Load model and index in new worker (in background)."""
+    model_api.warm_up()
+
+
+class ProductionServer(BaseApplication):
+    """Gunicorn application serving model_api.app with given options."""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return model_api.app
+
+
+def serve(host: str = '0.0.0.0', port: int = 6113,
+          workers: int | None = SERVER_WORKERS,
+          threads: int = SERVER_THREADS,
+          backlog: int = SERVER_BACKLOG,
+          max_in_flight: int | None = SERVER_MAX_IN_FLIGHT,
+          queue_limit: int = SERVER_QUEUE_LIMIT,
+          timeout: int = SERVER_TIMEOUT,
+          model_pth: str | None = None,
+          index_dir: str | None = None,
+          result_cache_entries: int = RESULT_CACHE_MAX_ENTRIES):
+    """
+    Raise production server on host:port (blocks until stopped).
+
+    Args:
+        host (str, optional): host. Defaults to '0.0.0.0'.
+        port (int, optional): port. Defaults to 6113.
+        workers (int, optional): worker processes. Defaults to
+            SERVER_WORKERS (None - os.cpu_count()).
+        threads (int, optional): threads per worker (they wait for io
+            while other thread embeds). Defaults to SERVER_THREADS.
+        backlog (int, optional): connections waiting to be accepted.
+            Defaults to SERVER_BACKLOG.
+        max_in_flight (int, optional): requests processed by one worker
+            at once, others get 503 (must be less than threads: only
+            spare threads can answer). None - no limit. Defaults to
+            SERVER_MAX_IN_FLIGHT.
+        queue_limit (int, optional): connections accepted by one worker
+            above threads (waiting for a thread). Defaults to
+            SERVER_QUEUE_LIMIT.
+        timeout (int, optional): seconds before silent worker is
+            restarted. Defaults to SERVER_TIMEOUT.
+        model_pth (str, optional): FastText model path. Defaults to None
+            (MODEL_PTH from config).
+        index_dir (str, optional): columnar index directory. Defaults
+            to None (INDEX_DIR from config).
+        result_cache_entries (int, optional): result cache size of every
+            worker, 0 disables it. Defaults to RESULT_CACHE_MAX_ENTRIES.
+    """
+    if max_in_flight and max_in_flight >= threads:
+        raise ValueError(f'max_in_flight {max_in_flight} must be less than '
+                         f'threads {threads}, or requests are never '
+                         f'rejected')
+    model_api.configure(model_pth, index_dir)
+    model_api.set_max_in_flight(max_in_flight)
+    model_api.set_result_cache_size(result_cache_entries)
+    metrics_dir = tempfile.mkdtemp(prefix='column_search_metrics_')
+    metrics.set_multiprocess_dir(metrics_dir)
+    master_pid = os.getpid()
+    try:
+        ProductionServer({
+            'bind': f'{host}:{port}',
+            'workers': workers or os.cpu_count() or 1,
+            'worker_class': 'gthread',
+            'threads': threads,
+            'worker_connections': threads + queue_limit,
+            'backlog': backlog,
+            'timeout': timeout,
+            # workers load memory-mapped model themselves, see module doc
+            'preload_app': False,
+            'post_fork': _post_fork,
+        }).run()
+    finally:
+        # exiting workers (forked inside run) pass here too
+        if os.getpid() == master_pid:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
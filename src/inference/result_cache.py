@@ -0,0 +1,93 @@
+"""Content-addressed cache of server responses with TTL and LRU eviction."""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+import numpy as np
+from config import RESULT_CACHE_QUANTUM
+
+
+def content_key(data: bytes) -> str:
+    """blake2b digest of content."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def vector_key(vector, quantum: float = RESULT_CACHE_QUANTUM) -> str:
+    """Digest of vector rounded to quantum (close queries share key)."""
+    quantized = np.round(np.asarray(vector, dtype=np.float64) / quantum)
+    return content_key(quantized.astype(np.int64).tobytes())
+
+
+class ResultCache:
+    """
+    LRU cache of responses, entries expire after ttl seconds.
+
+    invalidate() drops all entries (on index reload); results computed
+    over the old index are not put after it (see generation).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Get cached value or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation: int):
+        """Cache value computed when cache had generation."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries (results being computed are still put)."""
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self) -> int:
+        """
+        Drop all entries and results being computed now, return new
+        generation.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+            return self.generation
+
+    def stats(self) -> dict:
+        """Get hits, misses, hit rate and size of cache."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+            }
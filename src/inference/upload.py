@@ -0,0 +1,118 @@
+"""
+Streaming csv upload: request body is decoded to csv lines while it is
+read, with size limit and timeout.
+
+Body is raw csv (any content type, chunked transfer encoding too) or
+multipart/form-data, then the first file part (or part named 'file') is
+taken.
+"""
+import codecs
+import time
+from typing import Iterator
+from werkzeug.sansio.multipart import (Data, Epilogue, File,
+                                       MultipartDecoder, NeedData)
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Upload is rejected: status is http code of response."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadReader:
+    """
+    Reads request stream by blocks, checks limits on every block.
+
+    Timeout is checked between blocks: a client that sends nothing at all
+    is cut by the server (worker) timeout.
+    """
+
+    def __init__(self, stream, max_bytes: int, timeout: float,
+                 read_size: int = READ_SIZE):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.read_size = read_size
+        self.bytes_read = 0
+        self._deadline = time.monotonic() + timeout
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            block = self.stream.read(self.read_size)
+            if not block:
+                return
+            self.bytes_read += len(block)
+            if self.bytes_read > self.max_bytes:
+                raise UploadError(f'Upload is larger than {self.max_bytes} '
+                                  'bytes', 413)
+            if time.monotonic() > self._deadline:
+                raise UploadError(f'Upload takes more than {self.timeout} '
+                                  'sec', 408)
+            yield block
+
+
+def iter_multipart_file(blocks, boundary: bytes) -> Iterator[bytes]:
+    """Yield content of the first file part of multipart body."""
+    decoder = MultipartDecoder(boundary)
+    in_file = found = False
+    for block in blocks:
+        decoder.receive_data(block)
+        event = decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, File) and not found:
+                in_file = found = True
+            elif isinstance(event, Data) and in_file:
+                yield event.data
+                in_file = event.more_data
+            elif isinstance(event, Epilogue):
+                break
+            event = decoder.next_event()
+        if found and not in_file:
+            return
+    if not found:
+        raise UploadError('No file in multipart upload', 400)
+
+
+def iter_lines(blocks, encoding: str = 'utf-8') -> Iterator[str]:
+    """
+    Decode byte blocks to lines (with line ends) incrementally.
+
+    Only newline character ends a line (str.splitlines would break csv
+    records on other unicode line breaks).
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    tail = ''
+    for block in blocks:
+        lines = (tail + decoder.decode(block)).split('\n')
+        # last line is incomplete
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def upload_blocks(request, max_bytes: int, timeout: float
+                  ) -> tuple[Iterator[bytes], 'UploadReader']:
+    """Get blocks of uploaded csv (multipart is decoded) and body reader."""
+    if request.content_length is not None and \
+            request.content_length > max_bytes:
+        raise UploadError(f'Upload is larger than {max_bytes} bytes', 413)
+    reader = UploadReader(request.stream, max_bytes, timeout)
+    blocks = iter(reader)
+    if request.mimetype == 'multipart/form-data':
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise UploadError('No boundary in multipart upload', 400)
+        blocks = iter_multipart_file(blocks, boundary.encode())
+    return blocks, reader
+
+
+def upload_encoding(request) -> str:
+    """Charset of uploaded csv (utf-8 by default)."""
+    return request.mimetype_params.get('charset', 'utf-8')
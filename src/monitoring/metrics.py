@@ -0,0 +1,314 @@
+"""
+Hot path metrics: stage timings and counts in Prometheus text format.
+
+Embedding and search code wrap its stages in `stage(name)` and report
+amounts by `count(name, value)`. Inside `track_request` the same values
+are also summed per request (per thread / context), so server can return
+stage breakdown of one request.
+
+With several server processes every process writes its metrics to
+<pid>.json in a shared directory (see set_multiprocess_dir) from a
+background thread at most every SNAPSHOT_INTERVAL seconds (not on the
+request path), and render_metrics sums the files of all processes.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+import bisect
+import json
+import os
+import threading
+import time
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# seconds between snapshots of process metrics in shared directory
+SNAPSHOT_INTERVAL = 1.0
+
+
+class Histogram:
+    """Cumulative histogram with labels (thread safe)."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple = (), buckets: tuple = TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels values -> [bucket counts..., +Inf count], sum
+        self._counts = {}
+        self._sums = defaultdict(float)
+
+    def observe(self, value: float, *labels: str):
+        """Add one observation with labels values (in labelnames order)."""
+        ind = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(
+                labels, [0] * (len(self.buckets) + 1))
+            counts[ind] += 1
+            self._sums[labels] += value
+
+    def empty(self) -> 'Histogram':
+        """New histogram with the same name, labels and buckets."""
+        return Histogram(self.name, self.documentation, self.labelnames,
+                         self.buckets)
+
+    def state(self) -> list:
+        """Json serializable [labels, bucket counts, sum] of all labels."""
+        with self._lock:
+            return [[list(labels), list(counts), self._sums[labels]]
+                    for labels, counts in self._counts.items()]
+
+    def merge(self, state: list):
+        """Add state of other process."""
+        with self._lock:
+            for labels, counts, total in state:
+                labels = tuple(labels)
+                own = self._counts.setdefault(
+                    labels, [0] * (len(self.buckets) + 1))
+                for ind, value in enumerate(counts):
+                    own[ind] += value
+                self._sums[labels] += total
+
+    def render(self) -> Iterator[str]:
+        """Lines of Prometheus text format."""
+        with self._lock:
+            items = [(labels, list(counts), self._sums[labels])
+                     for labels, counts in sorted(self._counts.items())]
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',),
+                                           counts):
+                cumulative += bucket_count
+                yield (f'{self.name}_bucket'
+                       f'{_labels(self.labelnames, labels, le=bound)} '
+                       f'{cumulative}')
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {total}'
+            yield (f'{self.name}_count{_labels(self.labelnames, labels)} '
+                   f'{cumulative}')
+
+
+class Counter:
+    """Monotonic counter with labels (thread safe)."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, value: float = 1, *labels: str):
+        """Increase counter of labels values by value."""
+        with self._lock:
+            self._values[labels] += value
+
+    def empty(self) -> 'Counter':
+        """New counter with the same name and labels."""
+        return Counter(self.name, self.documentation, self.labelnames)
+
+    def state(self) -> list:
+        """Json serializable [labels, value] of all labels."""
+        with self._lock:
+            return [[list(labels), value]
+                    for labels, value in self._values.items()]
+
+    def merge(self, state: list):
+        """Add state of other process."""
+        with self._lock:
+            for labels, value in state:
+                self._values[tuple(labels)] += value
+
+    def get(self, *labels: str) -> float:
+        """Value of labels values."""
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> Iterator[str]:
+        """Lines of Prometheus text format."""
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+def _labels(labelnames: tuple, labels: tuple, **extra) -> str:
+    """Format {name="value",...} (empty string without labels)."""
+    pairs = list(zip(labelnames, labels)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+STAGE_SECONDS = Histogram('column_search_stage_seconds',
+                          'Time of hot path stage.', ('stage',))
+REQUEST_SECONDS = Histogram('column_search_request_seconds',
+                            'Time of http request.', ('endpoint',))
+REQUEST_COUNTS = Histogram('column_search_request_items',
+                           'Items processed by one http request '
+                           '(rows, tokens, cache_hits, cache_misses, '
+                           'result_cache_hits, result_cache_misses, '
+                           'neighbours).', ('endpoint', 'item'),
+                           buckets=COUNT_BUCKETS)
+ITEMS_TOTAL = Counter('column_search_items_total',
+                      'Items processed by the server.', ('item',))
+METRICS = (STAGE_SECONDS, REQUEST_SECONDS, REQUEST_COUNTS, ITEMS_TOTAL)
+
+# directory shared by server processes (None - single process)
+_multiprocess_dir: str | None = None
+_write_lock = threading.Lock()
+# metrics changed since last snapshot, pid of process with writer thread
+_snapshot_dirty = False
+_writer_pid: int | None = None
+
+_request_stats: ContextVar['RequestStats | None'] = ContextVar(
+    '_request_stats', default=None)
+
+
+class RequestStats:
+    """Stage seconds and item counts of one request."""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.start = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Seconds since request start."""
+        return time.perf_counter() - self.start
+
+    def as_dict(self) -> dict:
+        """Stage breakdown for json response (so far)."""
+        return {'total_sec': self.elapsed(),
+                'stages_sec': dict(self.stages),
+                'counts': dict(self.counts)}
+
+
+@contextmanager
+def stage(name: str):
+    """Time block as stage name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.stages[name] += elapsed
+
+
+def count(item: str, value: int):
+    """Report value processed items (rows, tokens...)."""
+    if not value:
+        return
+    ITEMS_TOTAL.inc(value, item)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.counts[item] += value
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator['RequestStats']:
+    """Collect stats of request, observe them into histograms at exit."""
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+        REQUEST_SECONDS.observe(stats.elapsed(), endpoint)
+        for item, value in stats.counts.items():
+            REQUEST_COUNTS.observe(value, endpoint, item)
+        _schedule_snapshot()
+
+
+def set_multiprocess_dir(pth: str | None):
+    """Share metrics of processes through files in pth (set before fork)."""
+    global _multiprocess_dir
+    _multiprocess_dir = pth
+
+
+def _schedule_snapshot():
+    """Mark metrics changed, start writer thread in this process once."""
+    global _snapshot_dirty, _writer_pid
+    if _multiprocess_dir is None:
+        return
+    _snapshot_dirty = True
+    # forked worker does not inherit writer thread of its parent
+    if _writer_pid != os.getpid():
+        with _write_lock:
+            if _writer_pid != os.getpid():
+                _writer_pid = os.getpid()
+                threading.Thread(target=_snapshot_writer,
+                                 daemon=True).start()
+
+
+def _snapshot_writer():
+    """Write snapshot of changed metrics every SNAPSHOT_INTERVAL."""
+    global _snapshot_dirty
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        if _snapshot_dirty:
+            _snapshot_dirty = False
+            write_snapshot()
+
+
+def write_snapshot():
+    """Write metrics of this process to shared directory (if it is set)."""
+    if _multiprocess_dir is None:
+        return
+    pth = os.path.join(_multiprocess_dir, f'{os.getpid()}.json')
+    with _write_lock:
+        snapshot = {metric.name: metric.state() for metric in METRICS}
+        with open(pth + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(pth + '.tmp', pth)
+
+
+def collect_metrics() -> tuple:
+    """
+    METRICS summed over all processes of shared directory.
+
+    Files of finished processes are kept, so counters do not decrease.
+    """
+    if _multiprocess_dir is None:
+        return METRICS
+    write_snapshot()
+    merged = tuple(metric.empty() for metric in METRICS)
+    for name in os.listdir(_multiprocess_dir):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_multiprocess_dir, name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric in merged:
+            metric.merge(snapshot.get(metric.name, []))
+    return merged
+
+
+def item_totals(*items: str) -> list[float]:
+    """Items processed by all server processes (files are read once)."""
+    totals = collect_metrics()[METRICS.index(ITEMS_TOTAL)]
+    return [totals.get(item) for item in items]
+
+
+def render_metrics() -> str:
+    """All metrics (of all processes) in Prometheus text format."""
+    lines = []
+    for metric in collect_metrics():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
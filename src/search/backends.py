@@ -0,0 +1,338 @@
+"""Nearest neighbours search backends over column embeddings."""
+from abc import ABC, abstractmethod
+import numpy as np
+from scipy import spatial
+from src.embeddings.quantization import ProductQuantizer, kmeans
+
+
+def _as_queries(queries) -> tuple[np.ndarray, bool]:
+    """Get 2d float32 queries matrix and flag of single query."""
+    queries = np.asarray(queries, dtype=np.float32)
+    single = queries.ndim == 1
+    return np.atleast_2d(queries), single
+
+
+def _top_k(distances: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Get k smallest distances (sorted) and their positions in each row."""
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(k), distances.shape).copy()
+    part_dist = np.take_along_axis(distances, part, axis=1)
+    order = np.argsort(part_dist, axis=1)
+    return (np.take_along_axis(part_dist, order, axis=1),
+            np.take_along_axis(part, order, axis=1))
+
+
+def _squared_norms(vectors: np.ndarray, block_size: int = 65536
+                   ) -> np.ndarray:
+    """Squared norms of rows in float32 (vectors can be float16 mmap)."""
+    norms = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size],
+                           dtype=np.float32)
+        norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+    return norms
+
+
+def _squared_distances(queries: np.ndarray, vectors: np.ndarray,
+                       vectors_norms: np.ndarray) -> np.ndarray:
+    """Squared euclidean distances queries x vectors via one matmul."""
+    dist = vectors_norms[None, :] - 2 * (queries @ vectors.T)
+    dist += np.einsum('ij,ij->i', queries, queries)[:, None]
+    return np.maximum(dist, 0, out=dist)
+
+
+class SearchBackend(ABC):
+    """
+    Base class of search backends.
+
+    query has the same signature and result as scipy KDTree.query:
+    (distances, indices), 1d arrays for one query, 2d for matrix.
+    metric is 'euclidean' or 'cosine' (distance = 1 - cosine similarity).
+    """
+
+    name = None
+    metric = 'euclidean'
+
+    def __init__(self, vectors: np.ndarray):
+        """Build backend over vectors matrix (can be memory-mapped)."""
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def query(self, queries, k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """Get distances and indices of k nearest vectors."""
+        queries, single = _as_queries(queries)
+        distances, indices = self._query(queries, k)
+        if single:
+            return distances[0], indices[0]
+        return distances, indices
+
+    @abstractmethod
+    def _query(self, queries: np.ndarray, k: int
+               ) -> tuple[np.ndarray, np.ndarray]:
+        """Get distances and indices for 2d queries matrix."""
+
+
+class KDTreeBackend(SearchBackend):
+    """scipy KDTree (exact, degrades to brute force in high dimensions)."""
+
+    name = 'kdtree'
+
+    def __init__(self, vectors: np.ndarray):
+        super().__init__(vectors)
+        self.tree = spatial.KDTree(vectors)
+
+    def _query(self, queries, k):
+        k = min(k, len(self))
+        distances, indices = self.tree.query(queries, k=k)
+        return (distances.reshape(len(queries), k),
+                indices.reshape(len(queries), k))
+
+
+class BruteForceBackend(SearchBackend):
+    """Exact search: distances to all vectors by BLAS matmul."""
+
+    name = 'brute'
+
+    def __init__(self, vectors: np.ndarray, block_size: int = 65536):
+        """block_size -- index rows per matmul (bounds memory)."""
+        super().__init__(vectors)
+        self.block_size = block_size
+        self.norms = _squared_norms(vectors, block_size)
+
+    def _block_distances(self, queries: np.ndarray, start: int,
+                         block: np.ndarray) -> np.ndarray:
+        """Distances (any monotone form) of queries to index block."""
+        return _squared_distances(
+            queries, block, self.norms[start:start + len(block)])
+
+    def _final_distances(self, distances: np.ndarray) -> np.ndarray:
+        """Convert block distances to returned ones."""
+        return np.sqrt(distances)
+
+    def _query(self, queries, k):
+        best_dist = best_ind = None
+        for start in range(0, len(self), self.block_size):
+            block = np.asarray(self.vectors[start:start + self.block_size],
+                               dtype=np.float32)
+            dist, ind = _top_k(self._block_distances(queries, start, block),
+                               k)
+            ind += start
+            if best_dist is not None:
+                dist = np.hstack([best_dist, dist])
+                ind = np.hstack([best_ind, ind])
+                dist, pos = _top_k(dist, k)
+                ind = np.take_along_axis(ind, pos, axis=1)
+            best_dist, best_ind = dist, ind
+        return self._final_distances(best_dist), best_ind
+
+
+class CosineBackend(BruteForceBackend):
+    """
+    Exact cosine search: one matmul with normalized query.
+
+    Index rows are normalized once at build time by stored inverse norms
+    (memory-mapped matrix is not copied). Distance is 1 - cosine.
+    """
+
+    name = 'cosine'
+    metric = 'cosine'
+
+    def __init__(self, vectors: np.ndarray, block_size: int = 65536):
+        super().__init__(vectors, block_size)
+        norms = np.sqrt(self.norms)
+        self.inv_norms = np.divide(1, norms, out=np.zeros_like(norms),
+                                   where=norms > 0)
+
+    def _query(self, queries, k):
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = np.divide(queries, norms, out=np.zeros_like(queries),
+                            where=norms > 0)
+        return super()._query(queries, k)
+
+    def _block_distances(self, queries, start, block):
+        similarity = (queries @ block.T) * \
+            self.inv_norms[start:start + len(block)]
+        return 1 - similarity
+
+    def _final_distances(self, distances):
+        return distances
+
+
+class IVFBackend(SearchBackend):
+    """
+    Approximate search with inverted file index.
+
+    Vectors are split by k-means into n_lists clusters; query is compared
+    only with vectors of its nprobe nearest clusters.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, vectors: np.ndarray, n_lists: int | None = None,
+                 nprobe: int = 8, n_iter: int = 10,
+                 train_size: int = 256, seed: int = 42):
+        """
+        Train centroids and build inverted lists.
+
+        Args:
+            vectors (np.ndarray): index vectors.
+            n_lists (int, optional): clusters count. Defaults to None
+                (sqrt of vectors count).
+            nprobe (int, optional): clusters searched per query.
+                Defaults to 8.
+            n_iter (int, optional): k-means iterations. Defaults to 10.
+            train_size (int, optional): training vectors per cluster.
+                Defaults to 256.
+            seed (int, optional): random seed. Defaults to 42.
+        """
+        super().__init__(vectors)
+        n = len(vectors)
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(n)), n))
+        self.nprobe = nprobe
+        rng = np.random.default_rng(seed)
+        train_ind = np.sort(rng.choice(
+            n, min(n, self.n_lists * train_size), replace=False))
+        train = np.asarray(vectors[train_ind], dtype=np.float32)
+        self.centroids = kmeans(train, self.n_lists, n_iter, rng)
+        labels = np.concatenate([
+            self._assign(np.asarray(vectors[start:start + 65536],
+                                    dtype=np.float32))
+            for start in range(0, n, 65536)]) if n else np.zeros(0, int)
+        # inverted lists: vector ids sorted by cluster + list offsets
+        self.list_ids = np.argsort(labels, kind='stable')
+        self.list_offsets = np.searchsorted(labels[self.list_ids],
+                                            np.arange(self.n_lists + 1))
+        self.norms = _squared_norms(vectors)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Get nearest centroid of every vector."""
+        centroid_norms = np.einsum('ij,ij->i', self.centroids,
+                                   self.centroids)
+        return np.argmin(_squared_distances(vectors, self.centroids,
+                                            centroid_norms), axis=1)
+
+    def _query(self, queries, k):
+        centroid_norms = np.einsum('ij,ij->i', self.centroids,
+                                   self.centroids)
+        _, probes = _top_k(_squared_distances(queries, self.centroids,
+                                              centroid_norms), self.nprobe)
+        res_dist = np.full((len(queries), k), np.inf, dtype=np.float32)
+        res_ind = np.full((len(queries), k), len(self), dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+                for c in probes[i]])
+            candidates.sort()
+            dist, pos = _top_k(_squared_distances(
+                query[None, :],
+                np.asarray(self.vectors[candidates], dtype=np.float32),
+                self.norms[candidates]), k)
+            res_dist[i, :dist.shape[1]] = np.sqrt(dist[0])
+            res_ind[i, :pos.shape[1]] = candidates[pos[0]]
+        return res_dist, res_ind
+
+
+class PQBackend(SearchBackend):
+    """
+    Approximate search over product quantization codes with re-ranking.
+
+    First pass: distances of query to PQ codes of all vectors by lookup
+    tables (n_subvectors bytes per vector are scanned). Then rerank best
+    candidates are re-ranked by exact distances to their vectors, which
+    are read only for them (vectors can stay memory-mapped, float16).
+    """
+
+    name = 'pq'
+
+    def __init__(self, vectors: np.ndarray,
+                 codebooks: np.ndarray | None = None,
+                 codes: np.ndarray | None = None, n_subvectors: int = 8,
+                 rerank: int = 100, block_size: int = 65536, **train_params):
+        """
+        Use saved codebooks and codes of index or train quantizer.
+
+        Args:
+            vectors (np.ndarray): index vectors.
+            codebooks (np.ndarray, optional): trained codebooks. Defaults
+                to None (quantizer is trained on vectors).
+            codes (np.ndarray, optional): codes of vectors by codebooks.
+                Defaults to None (vectors are encoded).
+            n_subvectors (int, optional): bytes per code if quantizer is
+                trained. Defaults to 8.
+            rerank (int, optional): candidates re-ranked by exact
+                distance, 0 - return approximate distances. Defaults to
+                100.
+            block_size (int, optional): codes per lookup block. Defaults
+                to 65536.
+            train_params: other params of ProductQuantizer.
+        """
+        super().__init__(vectors)
+        if codebooks is None:
+            self.quantizer = ProductQuantizer(n_subvectors, **train_params)
+            self.quantizer.fit(vectors)
+        else:
+            self.quantizer = ProductQuantizer.from_codebooks(codebooks)
+        if codes is None or codebooks is None:
+            codes = self.quantizer.encode(vectors, block_size)
+        self.codes = np.asarray(codes)
+        self.rerank = rerank
+        self.block_size = block_size
+
+    def _adc_top(self, queries: np.ndarray, k: int
+                 ) -> tuple[np.ndarray, np.ndarray]:
+        """Get k smallest approximate squared distances and their ids."""
+        tables = self.quantizer.distance_tables(queries)
+        best_dist = best_ind = None
+        for start in range(0, len(self), self.block_size):
+            dist, ind = _top_k(self.quantizer.adc_distances(
+                tables, self.codes[start:start + self.block_size]), k)
+            ind += start
+            if best_dist is not None:
+                dist, pos = _top_k(np.hstack([best_dist, dist]), k)
+                ind = np.take_along_axis(np.hstack([best_ind, ind]), pos,
+                                         axis=1)
+            best_dist, best_ind = dist, ind
+        return best_dist, best_ind
+
+    def _query(self, queries, k):
+        k = min(k, len(self))
+        dist, ind = self._adc_top(queries, max(k, self.rerank))
+        if self.rerank <= 0:
+            return np.sqrt(np.maximum(dist, 0)), ind
+        res_dist = np.empty((len(queries), k), dtype=np.float32)
+        res_ind = np.empty((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.sort(ind[i])
+            exact = np.asarray(self.vectors[candidates],
+                               dtype=np.float32) - query
+            exact_dist, pos = _top_k(
+                np.einsum('ij,ij->i', exact, exact)[None, :], k)
+            res_dist[i] = np.sqrt(exact_dist[0])
+            res_ind[i] = candidates[pos[0]]
+        return res_dist, res_ind
+
+
+BACKENDS = {backend.name: backend for backend in
+            (KDTreeBackend, BruteForceBackend, CosineBackend, IVFBackend,
+             PQBackend)}
+
+
+def make_backend(name: str, vectors: np.ndarray, **params) -> SearchBackend:
+    """Build backend by name ('kdtree', 'brute', 'cosine', 'ivf', 'pq')."""
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown search backend {name}. '
+                         f'Available: {", ".join(BACKENDS)}')
+    return BACKENDS[name](vectors, **params)
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray, k: int) -> float:
+    """Mean share of true k nearest found in first k results."""
+    found = np.atleast_2d(found)[:, :k]
+    expected = np.atleast_2d(expected)[:, :k]
+    hits = sum(len(np.intersect1d(f, e)) for f, e in zip(found, expected))
+    return hits / expected.size
@@ -0,0 +1,104 @@
+"""LSH index over MinHash signatures: columns with high value overlap."""
+import numpy as np
+from src.embeddings.sketches import EMPTY_HASH
+
+# odd multiplier of band key polynomial hash
+_KEY_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def lsh_params(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    Get bands and rows per band for Jaccard threshold.
+
+    Columns with Jaccard s share a band with probability
+    1 - (1 - s**rows)**bands, (1/bands)**(1/rows) is the steepest point.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashLSH:
+    """
+    Banded LSH: signature is split into bands, columns with equal band
+    are candidates. Every band is a sorted array of band keys, so lookup
+    is binary search, candidates are re-ranked by estimated Jaccard.
+    """
+
+    def __init__(self, minhashes: np.ndarray, threshold: float = 0.5,
+                 bands: int | None = None, block_size: int = 65536):
+        """
+        Build index over minhashes matrix (can be memory-mapped).
+
+        Args:
+            minhashes (np.ndarray): signatures, columns x num_perm.
+            threshold (float, optional): Jaccard threshold to pick bands.
+                Defaults to 0.5.
+            bands (int, optional): bands count (overrides threshold).
+                Defaults to None.
+            block_size (int, optional): signatures per processed block.
+                Defaults to 65536.
+        """
+        self.minhashes = minhashes
+        num_perm = minhashes.shape[1]
+        if bands is None:
+            self.bands, self.rows = lsh_params(num_perm, threshold)
+        else:
+            self.bands, self.rows = bands, num_perm // bands
+        keys, ids = [], []
+        for start in range(0, len(minhashes), block_size):
+            block = np.asarray(minhashes[start:start + block_size])
+            # columns without values are never candidates
+            not_empty = np.flatnonzero((block != EMPTY_HASH).any(axis=1))
+            keys.append(self._band_keys(block[not_empty]))
+            ids.append(not_empty + start)
+        keys = np.concatenate(keys) if keys else \
+            np.zeros((0, self.bands), dtype=np.uint64)
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        order = np.argsort(keys, axis=0, kind='stable')
+        self.band_ids = ids[order].T.copy()
+        self.band_keys = np.take_along_axis(keys, order, axis=0).T.copy()
+
+    def __len__(self):
+        return len(self.minhashes)
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """Hash every band of signatures to one uint64 key."""
+        bands = signatures[:, :self.bands * self.rows].reshape(
+            len(signatures), self.bands, self.rows)
+        keys = np.zeros(bands.shape[:2], dtype=np.uint64)
+        for row in range(self.rows):
+            keys = keys * _KEY_MULTIPLIER + bands[:, :, row]
+        return keys
+
+    def candidates(self, signature: np.ndarray) -> np.ndarray:
+        """Ids of columns sharing at least one band with signature."""
+        keys = self._band_keys(np.asarray(signature)[None, :])[0]
+        found = []
+        for band, key in enumerate(keys):
+            left = np.searchsorted(self.band_keys[band], key, 'left')
+            right = np.searchsorted(self.band_keys[band], key, 'right')
+            found.append(self.band_ids[band, left:right])
+        return np.unique(np.concatenate(found))
+
+    def query(self, signature: np.ndarray, k: int = 10,
+              min_jaccard: float = 0.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get estimated Jaccard and ids of up to k most overlapping columns.
+
+        Only LSH candidates are compared, so columns below threshold can
+        be missed (they are unlikely to share a band).
+        """
+        signature = np.asarray(signature, dtype=np.uint64)
+        if (signature == EMPTY_HASH).all():
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        ids = self.candidates(signature)
+        jaccard = (np.asarray(self.minhashes[ids]) == signature).mean(axis=1)
+        keep = jaccard >= min_jaccard
+        ids, jaccard = ids[keep], jaccard[keep]
+        order = np.argsort(-jaccard, kind='stable')[:k]
+        return jaccard[order], ids[order]
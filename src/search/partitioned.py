@@ -0,0 +1,79 @@
+"""Search index partitioned by column type."""
+import numpy as np
+from src.search.backends import (BACKENDS, SearchBackend, _as_queries,
+                                 _top_k, make_backend)
+
+# partitions searched for query column of the type
+COMPATIBLE_TYPES = {
+    'integer': ('integer', 'float'),
+    'float': ('float', 'integer'),
+    'date': ('date',),
+    'categorical': ('categorical', 'text'),
+    'text': ('text', 'categorical'),
+}
+# backend params with a row per vector, split to partitions too
+ROW_PARAMS = ('codes',)
+
+
+class PartitionedBackend(SearchBackend):
+    """
+    One backend per column type, query searches compatible partitions.
+
+    Without col_type (or with unknown one) all partitions are searched.
+    Rows of one type are contiguous in the index (see save_columns_index),
+    so partitions are slices of memory-mapped vectors, nothing is copied.
+    """
+
+    name = 'partitioned'
+
+    def __init__(self, vectors: np.ndarray,
+                 partitions: dict[str, tuple[int, int]],
+                 backend: str = 'kdtree', **params):
+        """Build backend named backend (with params) for every type."""
+        super().__init__(vectors)
+        self.metric = BACKENDS[backend].metric
+        self.partitions = {}
+        for col_type, (start, end) in partitions.items():
+            if start == end:
+                continue
+            part_params = {name: value[start:end]
+                           if name in ROW_PARAMS and value is not None
+                           else value
+                           for name, value in params.items()}
+            self.partitions[col_type] = (
+                start, make_backend(backend, vectors[start:end],
+                                    **part_params))
+
+    def query(self, queries, k: int = 10, col_type: str | None = None
+              ) -> tuple[np.ndarray, np.ndarray]:
+        """Get distances and indices of k nearest compatible vectors."""
+        queries, single = _as_queries(queries)
+        distances, indices = self._search(
+            queries, k, COMPATIBLE_TYPES.get(col_type, self.partitions))
+        if single:
+            return distances[0], indices[0]
+        return distances, indices
+
+    def _query(self, queries, k):
+        return self._search(queries, k, self.partitions)
+
+    def _search(self, queries: np.ndarray, k: int, col_types
+                ) -> tuple[np.ndarray, np.ndarray]:
+        """Search partitions of col_types, merge k nearest."""
+        best_dist = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_ind = np.zeros((len(queries), 0), dtype=np.int64)
+        for col_type in col_types:
+            if col_type not in self.partitions:
+                continue
+            start, backend = self.partitions[col_type]
+            dist, ind = backend.query(queries, k)
+            # backends pad missing neighbours with inf / len(backend)
+            found = ind < len(backend)
+            ind = np.where(found, ind + start, len(self))
+            dist = np.where(found, dist, np.inf)
+            best_dist = np.hstack([best_dist, dist])
+            best_ind = np.hstack([best_ind, ind])
+        if best_dist.shape[1] == 0:
+            return best_dist, best_ind
+        best_dist, pos = _top_k(best_dist, k)
+        return best_dist, np.take_along_axis(best_ind, pos, axis=1)
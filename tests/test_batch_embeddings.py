@@ -0,0 +1,45 @@
+"""Batched column embeddings match the original per-cell loop."""
+import csv
+import numpy as np
+from gensim.models import FastText
+from benchmarks.embeddings_benchmark import reference_columns_embeddings
+from src.embeddings.get_embeddins import get_columns_embeddings
+
+
+def write_table(pth, rows):
+    with open(pth, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def test_batched_embeddings_match_reference_loop(tmp_path):
+    sentences = [['red', 'green', 'blue'], ['one', 'two', 'three'],
+                 ['2024-01-01', 'moscow', 'london']] * 20
+    model = FastText(sentences, vector_size=16, min_count=1, min_n=2,
+                     max_n=3, bucket=1000, epochs=2, seed=1, workers=1)
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    rng = np.random.default_rng(0)
+    words = ['red', 'green', 'blue', 'one', 'two', 'moscow', 'london',
+             'unseen', 'greenish', 'z', '2024-01-01', '']
+    for table in range(3):
+        n_cols = 3 + table
+        rows = [[f'col_{i}' for i in range(n_cols)]]
+        for _ in range(50):
+            rows.append([' '.join(rng.choice(words, rng.integers(0, 4)))
+                         for _ in range(n_cols)])
+        # rows with wrong cells count are skipped by both versions
+        rows.append(['bad row'])
+        write_table(data_dir / f'table_{table}.csv', rows)
+
+    # small chunks: sums are accumulated over several updates
+    batched = get_columns_embeddings(model, str(data_dir), chunk_size=7)
+    reference = reference_columns_embeddings(model, str(data_dir))
+
+    expected = {(emb.file_pth, emb.col_name): emb.embedding
+                for emb in reference}
+    assert {(emb.file_pth, emb.col_name) for emb in batched} == \
+        set(expected)
+    for emb in batched:
+        np.testing.assert_allclose(
+            emb.embedding, expected[(emb.file_pth, emb.col_name)],
+            rtol=1e-4, atol=1e-6)
@@ -0,0 +1,55 @@
+"""Incremental update of index saved without its manifest."""
+import csv
+import os
+import shutil
+from collections import Counter
+from gensim.models import FastText
+from src.embeddings.incremental_index import build_manifest, save_manifest, \
+    update_index
+from src.embeddings.parallel_index import build_index, save_index
+
+
+def write_table(pth, n_cols, n_rows=20):
+    with open(pth, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([f'col_{i}' for i in range(n_cols)])
+        for row in range(n_rows):
+            writer.writerow([f'value{row % 5} {i}' for i in range(n_cols)])
+
+
+def columns(embeddings):
+    return Counter((emb.file_pth, emb.col_name) for emb in embeddings)
+
+
+def test_update_after_build_without_manifest(tmp_path):
+    model = FastText([['value1', 'value2', 'value3']] * 10, vector_size=8,
+                     min_count=1, min_n=2, max_n=3, bucket=100, epochs=1,
+                     seed=1, workers=1)
+    model_pth = str(tmp_path / 'model')
+    model.save(model_pth)
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    write_table(data_dir / 'a.csv', 3)
+    write_table(data_dir / 'b.csv', 4)
+    index_dir = str(tmp_path / 'index')
+    manifest_pth = str(tmp_path / 'manifest.json')
+    params = {'index_dir': index_dir, 'manifest_pth': manifest_pth,
+              'workers': 1, 'verbose': False}
+    update_index(model_pth, str(data_dir), **params)
+
+    # copied file keeps mtime, index is rebuilt but manifest is not saved
+    shutil.copy2(data_dir / 'b.csv', data_dir / 'c.csv')
+    built = build_index(model_pth, str(data_dir), workers=1, verbose=False)
+    save_index(built, index_dir)
+    updated = update_index(model_pth, str(data_dir), **params)
+    assert columns(updated) == columns(built)
+    assert max(columns(updated).values()) == 1
+
+    # manifest saved with build: update only drops the deleted file
+    manifest = build_manifest(model_pth, str(data_dir))
+    save_index(built, index_dir)
+    save_manifest(manifest, manifest_pth)
+    os.remove(data_dir / 'a.csv')
+    updated = update_index(model_pth, str(data_dir), **params)
+    assert columns(updated) == columns(
+        emb for emb in built if not emb.file_pth.endswith('a.csv'))